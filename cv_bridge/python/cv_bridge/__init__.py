@@ -1,8 +1,10 @@
 from .core import CvBridge, CvBridgeError
 
+
 # python bindings
-# This try is just to satisfy doc jobs that are built differently.
-try:
-    from cv_bridge.boost.cv_bridge_boost import cvtColorForDisplay, getCvType
-except ImportError:
-    pass
+# These are imported on first use, since loading them also loads OpenCV.
+def __getattr__(name):
+    if name in ('cvtColorForDisplay', 'getCvType'):
+        from cv_bridge.boost import cv_bridge_boost
+        return getattr(cv_bridge_boost, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -33,6 +33,8 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ####################################################################
 
+import array
+import re
 import sys
 
 import sensor_msgs.msg
@@ -44,6 +46,87 @@ class CvBridgeError(TypeError):
     pass
 
 
+# OpenCV depths and the matching numpy types, from opencv2/core/hal/interface.h
+_CV_DEPTHS = {'8U': (0, 'uint8'), '8S': (1, 'int8'), '16U': (2, 'uint16'), '16S': (3, 'int16'),
+              '32S': (4, 'int32'), '32F': (5, 'float32'), '64F': (6, 'float64')}
+_CV_DEPTH_TO_NUMPY = dict(_CV_DEPTHS.values())
+_CV_CN_MAX = 512
+_CV_CN_SHIFT = 3
+_CV_DEPTH_MASK = (1 << _CV_CN_SHIFT) - 1
+
+# The encodings from sensor_msgs/image_encodings.h that getCvType() in cv_bridge.cpp recognizes
+_STANDARD_ENCODINGS = {
+    'bgr8': ('8U', 3), 'mono8': ('8U', 1),
+    'rgb8': ('8U', 3), 'mono16': ('16U', 1),
+    'bgr16': ('16U', 3), 'rgb16': ('16U', 3),
+    'bgra8': ('8U', 4), 'rgba8': ('8U', 4),
+    'bgra16': ('16U', 4), 'rgba16': ('16U', 4),
+    'bayer_rggb8': ('8U', 1), 'bayer_bggr8': ('8U', 1),
+    'bayer_gbrg8': ('8U', 1), 'bayer_grbg8': ('8U', 1),
+    'bayer_rggb16': ('16U', 1), 'bayer_bggr16': ('16U', 1),
+    'bayer_gbrg16': ('16U', 1), 'bayer_grbg16': ('16U', 1),
+    'yuv422': ('8U', 2), 'yuv422_yuy2': ('8U', 2),
+}
+_GENERIC_ENCODING = re.compile(r'(8U|8S|16U|16S|32S|32F|64F)(?:C([0-9]+))?')
+
+# encoding -> (numpy dtype name, number of channels, OpenCV type), filled in on first use
+_encoding_table = {}
+
+# (cvtype_to_name, cvdepth_to_numpy_depth, numpy_type_to_cvtype), shared by all CvBridge instances
+_type_tables = None
+
+
+def _cv_make_type(depth, n_channels):
+    return depth + ((n_channels - 1) << _CV_CN_SHIFT)
+
+
+def _cv_type_to_dtype_with_channels(cvtype):
+    n_channels = ((cvtype >> _CV_CN_SHIFT) & (_CV_CN_MAX - 1)) + 1
+    return _CV_DEPTH_TO_NUMPY[cvtype & _CV_DEPTH_MASK], n_channels
+
+
+def _get_type_tables():
+    global _type_tables
+    if _type_tables is None:
+        cvtype_to_name = {}
+        for name, (depth, _) in _CV_DEPTHS.items():
+            for n_channels in [1, 2, 3, 4]:
+                cvtype_to_name[_cv_make_type(depth, n_channels)] = '%sC%d' % (name, n_channels)
+
+        numpy_type_to_cvtype = {dtype: name for name, (_, dtype) in _CV_DEPTHS.items()}
+        numpy_type_to_cvtype.update({v: k for k, v in numpy_type_to_cvtype.items()})
+
+        _type_tables = (cvtype_to_name, dict(_CV_DEPTH_TO_NUMPY), numpy_type_to_cvtype)
+    return _type_tables
+
+
+def _encoding_info(encoding):
+    info = _encoding_table.get(encoding)
+    if info is not None:
+        return info
+
+    if encoding in _STANDARD_ENCODINGS:
+        depth_name, n_channels = _STANDARD_ENCODINGS[encoding]
+    else:
+        m = _GENERIC_ENCODING.fullmatch(encoding)
+        depth_name, n_channels = (m.group(1), int(m.group(2) or 1)) if m else (None, 0)
+    if 1 <= n_channels <= _CV_CN_MAX:
+        depth, dtype = _CV_DEPTHS[depth_name]
+        cvtype = _cv_make_type(depth, n_channels)
+    else:
+        # Leave anything else to cv_bridge itself, which raises for unknown encodings
+        from cv_bridge.boost.cv_bridge_boost import getCvType
+        try:
+            cvtype = getCvType(encoding)
+        except RuntimeError as e:
+            raise CvBridgeError(e)
+        dtype, n_channels = _cv_type_to_dtype_with_channels(cvtype)
+
+    info = (dtype, n_channels, cvtype)
+    _encoding_table[encoding] = info
+    return info
+
+
 class CvBridge(object):
     """
     The CvBridge is an object that converts between OpenCV Images and ROS Image messages.
@@ -68,40 +151,38 @@ class CvBridge(object):
     """
 
     def __init__(self):
-        import cv2
-        self.cvtype_to_name = {}
-        self.cvdepth_to_numpy_depth = {cv2.CV_8U: 'uint8', cv2.CV_8S: 'int8',
-                                       cv2.CV_16U: 'uint16', cv2.CV_16S: 'int16',
-                                       cv2.CV_32S: 'int32', cv2.CV_32F: 'float32',
-                                       cv2.CV_64F: 'float64'}
-
-        for t in ['8U', '8S', '16U', '16S', '32S', '32F', '64F']:
-            for c in [1, 2, 3, 4]:
-                nm = '%sC%d' % (t, c)
-                self.cvtype_to_name[getattr(cv2, 'CV_%s' % nm)] = nm
-
-        self.numpy_type_to_cvtype = {'uint8': '8U', 'int8': '8S', 'uint16': '16U',
-                                     'int16': '16S', 'int32': '32S', 'float32': '32F',
-                                     'float64': '64F'}
-        self.numpy_type_to_cvtype.update(dict((v, k) for (k, v) in self.numpy_type_to_cvtype.items()))
+        # Released messages, keyed by (height, step) and by format
+        self._imgmsg_pool = {}
+        self._compressed_imgmsg_pool = {}
+
+    # The type tables are built without OpenCV on first use, and shared by all instances
+
+    @property
+    def cvtype_to_name(self):
+        """Map from OpenCV type to its name, such as ``'8UC3'``, for up to 4 channels."""
+        return _get_type_tables()[0]
+
+    @property
+    def cvdepth_to_numpy_depth(self):
+        """Map from OpenCV depth to the name of the numpy type."""
+        return _get_type_tables()[1]
+
+    @property
+    def numpy_type_to_cvtype(self):
+        """Map from the name of a numpy type to the name of the OpenCV depth, and back."""
+        return _get_type_tables()[2]
 
     def dtype_with_channels_to_cvtype2(self, dtype, n_channels):
         return '%sC%d' % (self.numpy_type_to_cvtype[dtype.name], n_channels)
 
     def cvtype2_to_dtype_with_channels(self, cvtype):
-        from cv_bridge.boost.cv_bridge_boost import CV_MAT_CNWrap, CV_MAT_DEPTHWrap
-        return self.cvdepth_to_numpy_depth[CV_MAT_DEPTHWrap(cvtype)], CV_MAT_CNWrap(cvtype)
+        return _cv_type_to_dtype_with_channels(cvtype)
 
     def encoding_to_cvtype2(self, encoding):
-        from cv_bridge.boost.cv_bridge_boost import getCvType
-
-        try:
-            return getCvType(encoding)
-        except RuntimeError as e:
-            raise CvBridgeError(e)
+        return _encoding_info(encoding)[2]
 
     def encoding_to_dtype_with_channels(self, encoding):
-        return self.cvtype2_to_dtype_with_channels(self.encoding_to_cvtype2(encoding))
+        return _encoding_info(encoding)[:2]
 
     def compressed_imgmsg_to_cv2(self, cmprs_img_msg, desired_encoding='passthrough'):
         """
@@ -144,7 +225,7 @@ class CvBridge(object):
 
         return res
 
-    def imgmsg_to_cv2(self, img_msg, desired_encoding='passthrough'):
+    def imgmsg_to_cv2(self, img_msg, desired_encoding='passthrough', zero_copy=False):
         """
         Convert a sensor_msgs::Image message to an OpenCV :cpp:type:`cv::Mat`.
 
@@ -153,6 +234,8 @@ class CvBridge(object):
 
            * ``"passthrough"``
            * one of the standard strings in sensor_msgs/image_encodings.h
+        :param zero_copy: Whether to return a read-only view of the message data instead of a
+                          contiguous image
 
         :rtype: :cpp:type:`cv::Mat`
         :raises CvBridgeError: when conversion is not possible.
@@ -164,28 +247,44 @@ class CvBridge(object):
         or raises :exc:`cv_bridge.CvBridgeError` on failure.
 
         If the image only has one channel, the shape has size 2 (width and height)
+
+        If zero_copy is True, this behaves like the C++ ``toCvShare``: the image is a read-only
+        view of ``img_msg.data``, which is only valid while the message data is not modified. If
+        the rows of the message are padded, the view is strided rather than copied. The data is
+        only copied when it has to be converted, i.e. when the byte order differs from the
+        system's or desired_encoding differs from the message encoding. Otherwise the image is
+        C-contiguous, and rows are copied if they are padded.
+
+        If desired_encoding is the same as the message encoding, no color conversion is done and
+        the image is returned as for ``"passthrough"``.
         """
         import numpy as np
         dtype, n_channels = self.encoding_to_dtype_with_channels(img_msg.encoding)
         dtype = np.dtype(dtype)
         dtype = dtype.newbyteorder('>' if img_msg.is_bigendian else '<')
 
-        img_buf = np.asarray(img_msg.data, dtype=dtype) if isinstance(img_msg.data, list) else img_msg.data
+        img_buf = img_msg.data
+        if isinstance(img_buf, list):
+            img_buf = np.asarray(img_buf, dtype=np.uint8)
 
+        # View the message data row by row, skipping any padding at the end of the rows
         if n_channels == 1:
-            im = np.ndarray(shape=(img_msg.height, int(img_msg.step/dtype.itemsize)),
-                            dtype=dtype, buffer=img_buf)
-            im = np.ascontiguousarray(im[:img_msg.height, :img_msg.width])
+            im = np.ndarray(shape=(img_msg.height, img_msg.width), dtype=dtype, buffer=img_buf,
+                            strides=(img_msg.step, dtype.itemsize))
+        else:
+            im = np.ndarray(shape=(img_msg.height, img_msg.width, n_channels), dtype=dtype,
+                            buffer=img_buf,
+                            strides=(img_msg.step, dtype.itemsize * n_channels, dtype.itemsize))
+        if zero_copy:
+            im.setflags(write=False)
         else:
-            im = np.ndarray(shape=(img_msg.height, int(img_msg.step/dtype.itemsize/n_channels), n_channels),
-                            dtype=dtype, buffer=img_buf)
-            im = np.ascontiguousarray(im[:img_msg.height, :img_msg.width, :])
+            im = np.ascontiguousarray(im)
 
         # If the byte order is different between the message and the system.
         if img_msg.is_bigendian == (sys.byteorder == 'little'):
             im = im.byteswap().newbyteorder()
 
-        if desired_encoding == 'passthrough':
+        if desired_encoding == 'passthrough' or desired_encoding == img_msg.encoding:
             return im
 
         from cv_bridge.boost.cv_bridge_boost import cvtColor2
@@ -197,7 +296,7 @@ class CvBridge(object):
 
         return res
 
-    def cv2_to_compressed_imgmsg(self, cvim, dst_format='jpg'):
+    def cv2_to_compressed_imgmsg(self, cvim, dst_format='jpg', out=None):
         """
         Convert an OpenCV :cpp:type:`cv::Mat` type to a ROS sensor_msgs::CompressedImage message.
 
@@ -214,6 +313,7 @@ class CvBridge(object):
            * pbm, pgm, ppm
            * sr, ras
            * tiff, tif
+        :param out:       A sensor_msgs.msg.CompressedImage message to fill in instead of a new one
 
         :rtype:           A sensor_msgs.msg.CompressedImage message
         :raises CvBridgeError: when the ``cvim`` has a type that is incompatible with ``format``
@@ -221,22 +321,38 @@ class CvBridge(object):
 
         This function returns a sensor_msgs::Image message on success,
         or raises :exc:`cv_bridge.CvBridgeError` on failure.
+
+        If ``out`` is given, the compressed image is written into its data buffer, which is resized
+        in place, so that a message from :meth:`acquire_compressed_imgmsg` reuses the memory of its
+        previous frames.
         """
         import cv2
         import numpy as np
         if not isinstance(cvim, (np.ndarray, np.generic)):
             raise TypeError('Your input type is not a numpy array')
-        cmprs_img_msg = sensor_msgs.msg.CompressedImage()
+        cmprs_img_msg = sensor_msgs.msg.CompressedImage() if out is None else out
         cmprs_img_msg.format = dst_format
         ext_format = '.' + dst_format
         try:
-            cmprs_img_msg.data.frombytes(np.array(cv2.imencode(ext_format, cvim)[1]).tobytes())
+            encoded = cv2.imencode(ext_format, cvim)[1].reshape(-1)
         except RuntimeError as e:
             raise CvBridgeError(e)
 
+        data = cmprs_img_msg.data
+        if isinstance(data, array.array) and data.typecode == 'B':
+            # Resize the existing buffer, then overwrite the part that was kept
+            n_kept = min(len(data), len(encoded))
+            del data[n_kept:]
+            data.frombytes(encoded[n_kept:])
+            np.copyto(np.frombuffer(data, dtype=np.uint8, count=n_kept), encoded[:n_kept])
+        else:
+            data = array.array('B')
+            data.frombytes(encoded)
+        cmprs_img_msg.data = data
+
         return cmprs_img_msg
 
-    def cv2_to_imgmsg(self, cvim, encoding='passthrough', header = None):
+    def cv2_to_imgmsg(self, cvim, encoding='passthrough', header = None, out=None):
         """
         Convert an OpenCV :cpp:type:`cv::Mat` type to a ROS sensor_msgs::Image message.
 
@@ -246,6 +362,7 @@ class CvBridge(object):
            * ``"passthrough"``
            * one of the standard strings in sensor_msgs/image_encodings.h
         :param header:    A std_msgs.msg.Header message
+        :param out:       A sensor_msgs.msg.Image message to fill in instead of a new one
 
         :rtype:           A sensor_msgs.msg.Image message
         :raises CvBridgeError: when the ``cvim`` has a type that is incompatible with ``encoding``
@@ -255,11 +372,16 @@ class CvBridge(object):
 
         This function returns a sensor_msgs::Image message on success,
         or raises :exc:`cv_bridge.CvBridgeError` on failure.
+
+        The image data is copied into the message exactly once, also for slices of a larger image,
+        and the message buffer is never cleared before the image is copied into it. The rows of the
+        message are never padded. If ``out`` is given and its data already has the size of the
+        image, that buffer is reused and no memory is allocated.
         """
         import numpy as np
         if not isinstance(cvim, (np.ndarray, np.generic)):
             raise TypeError('Your input type is not a numpy array')
-        img_msg = sensor_msgs.msg.Image()
+        img_msg = sensor_msgs.msg.Image() if out is None else out
         img_msg.height = cvim.shape[0]
         img_msg.width = cvim.shape[1]
         if header is not None:
@@ -276,9 +398,114 @@ class CvBridge(object):
             if self.cvtype_to_name[self.encoding_to_cvtype2(encoding)] != cv_type:
                 raise CvBridgeError('encoding specified as %s, but image has incompatible type %s'
                                     % (encoding, cv_type))
-        if cvim.dtype.byteorder == '>':
-            img_msg.is_bigendian = True
-        img_msg.data.frombytes(cvim.tobytes())
-        img_msg.step = len(img_msg.data) // img_msg.height
+        img_msg.is_bigendian = cvim.dtype.byteorder == '>'
+        n_channels = 1 if len(cvim.shape) < 3 else cvim.shape[2]
+        img_msg.step = img_msg.width * n_channels * cvim.dtype.itemsize
+        n_bytes = img_msg.step * img_msg.height
+
+        data = img_msg.data
+        if isinstance(data, array.array) and data.typecode == 'B' and len(data) == n_bytes:
+            # Write into the existing message buffer
+            np.copyto(np.frombuffer(data, dtype=cvim.dtype).reshape(cvim.shape), cvim)
+        elif cvim.flags.c_contiguous:
+            data = array.array('B')
+            data.frombytes(cvim.reshape(-1).view(np.uint8))
+        else:
+            # array.array cannot be allocated without clearing it, so rather than clearing a buffer
+            # and copying the image over it, append the rows, which are contiguous for image slices
+            data = array.array('B')
+            if cvim.shape[0] > 0 and cvim[0].flags.c_contiguous:
+                for row in cvim:
+                    data.frombytes(row.view(np.uint8))
+            else:
+                data.frombytes(np.ascontiguousarray(cvim).reshape(-1).view(np.uint8))
+        img_msg.data = data
 
         return img_msg
+
+    def acquire_imgmsg(self, height, width, encoding):
+        """
+        Get a sensor_msgs::Image message with a data buffer for an image.
+
+        :param height:    The height of the image
+        :param width:     The width of the image
+        :param encoding:  One of the standard strings in sensor_msgs/image_encodings.h
+        :rtype:           A sensor_msgs.msg.Image message
+
+        The buffer has the size of an image of the given height, width and encoding. The message
+        is taken from the messages returned with :meth:`release_imgmsg` whose data buffer has the
+        same layout, or created if there is none. Pass it to :meth:`cv2_to_imgmsg` as ``out`` to
+        convert an image into it without allocating memory, and release it once it has been
+        published.
+        """
+        import numpy as np
+        dtype, n_channels = self.encoding_to_dtype_with_channels(encoding)
+        step = width * n_channels * np.dtype(dtype).itemsize
+        # Messages are pooled by the layout of their buffer rather than by encoding, as
+        # cv2_to_imgmsg() may have changed the encoding, e.g. to '8UC3' for 'passthrough'
+        pool = self._imgmsg_pool.get((height, step))
+        img_msg = None
+        if pool:
+            try:
+                img_msg = pool.pop()
+            except IndexError:
+                # Taken by another thread in the meantime
+                pass
+        if img_msg is None:
+            img_msg = sensor_msgs.msg.Image()
+            img_msg.height = height
+            img_msg.step = step
+            img_msg.data = array.array('B', [0]) * (step * height)
+        img_msg.width = width
+        img_msg.encoding = encoding
+        img_msg.is_bigendian = False
+        return img_msg
+
+    def release_imgmsg(self, img_msg):
+        """
+        Return a sensor_msgs::Image message to be reused by :meth:`acquire_imgmsg`.
+
+        :param img_msg:   A sensor_msgs.msg.Image message
+
+        The message must no longer be used by the caller. rclpy serializes messages when they are
+        published, so a message can be released as soon as ``publish`` returns.
+        Messages whose data does not match their size are not reused.
+        """
+        data = img_msg.data
+        if (not isinstance(data, array.array) or data.typecode != 'B' or
+                len(data) != img_msg.step * img_msg.height):
+            return
+        key = (img_msg.height, img_msg.step)
+        self._imgmsg_pool.setdefault(key, []).append(img_msg)
+
+    def acquire_compressed_imgmsg(self, dst_format='jpg'):
+        """
+        Get a sensor_msgs::CompressedImage message to fill in.
+
+        :param dst_format:  The format of the image data, as for :meth:`cv2_to_compressed_imgmsg`
+        :rtype:           A sensor_msgs.msg.CompressedImage message
+
+        Pass the message as ``out`` to :meth:`cv2_to_compressed_imgmsg`. It is taken from the
+        messages returned with :meth:`release_compressed_imgmsg`, and keeps the data buffer of its
+        previous use, or created if there is none for this format.
+        """
+        pool = self._compressed_imgmsg_pool.get(dst_format)
+        if pool:
+            try:
+                return pool.pop()
+            except IndexError:
+                pass
+        cmprs_img_msg = sensor_msgs.msg.CompressedImage()
+        cmprs_img_msg.format = dst_format
+        return cmprs_img_msg
+
+    def release_compressed_imgmsg(self, cmprs_img_msg):
+        """
+        Return a sensor_msgs::CompressedImage message to be reused.
+
+        :param cmprs_img_msg:   A sensor_msgs.msg.CompressedImage message
+
+        The message is returned by a later call to :meth:`acquire_compressed_imgmsg`. It must no
+        longer be used by the caller, see :meth:`release_imgmsg`.
+        """
+        self._compressed_imgmsg_pool.setdefault(cmprs_img_msg.format, []).append(cmprs_img_msg)
@@ -0,0 +1,76 @@
+"""
+Measures the time and the memory allocated per CvBridge.cv2_to_imgmsg call.
+
+The peak memory traced by tracemalloc during a call is reported in multiples of the
+frame size: about 1 means that only the message buffer was allocated and the image was
+copied straight into it, 2 that an intermediate copy was made as well, and 0 that the
+buffer of the ``out`` message was reused. The legacy conversion,
+``data.frombytes(cvim.tobytes())``, is included for comparison.
+
+Usage: python3 benchmark_cv2_to_imgmsg.py [--width W] [--height H] [--iterations N]
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+import tracemalloc
+
+from cv_bridge import CvBridge
+import numpy as np
+import sensor_msgs.msg
+
+
+def legacy_cv2_to_imgmsg(cvim):
+    img_msg = sensor_msgs.msg.Image()
+    img_msg.height, img_msg.width = cvim.shape[:2]
+    img_msg.data.frombytes(cvim.tobytes())
+    img_msg.step = len(img_msg.data) // img_msg.height
+    return img_msg
+
+
+def peak_bytes(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    bridge = CvBridge()
+    image = np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    # A region of a twice as wide image, with the same size as image
+    wide = np.random.randint(0, 256, (args.height, 2 * args.width, 3), dtype=np.uint8)
+    roi = wide[:, args.width // 2:args.width // 2 + args.width]
+    out = bridge.cv2_to_imgmsg(image)
+
+    cases = [
+        ('legacy tobytes', lambda: legacy_cv2_to_imgmsg(image)),
+        ('legacy tobytes, ROI', lambda: legacy_cv2_to_imgmsg(roi)),
+        ('contiguous', lambda: bridge.cv2_to_imgmsg(image)),
+        ('ROI', lambda: bridge.cv2_to_imgmsg(roi)),
+        ('contiguous, out=', lambda: bridge.cv2_to_imgmsg(image, out=out)),
+        ('ROI, out=', lambda: bridge.cv2_to_imgmsg(roi, out=out)),
+    ]
+
+    print('%dx%d bgr8 (%.1f MB), %d iterations'
+          % (args.width, args.height, image.nbytes / 1e6, args.iterations))
+    print('%-22s %10s %12s %8s' % ('case', 'ms/call', 'peak MB', 'frames'))
+    for name, fn in cases:
+        seconds = timeit.timeit(fn, number=args.iterations)
+        peak = peak_bytes(fn)
+        print('%-22s %10.2f %12.1f %8.2f'
+              % (name, 1000.0 * seconds / args.iterations, peak / 1e6, peak / float(image.nbytes)))
+
+
+if __name__ == '__main__':
+    main()
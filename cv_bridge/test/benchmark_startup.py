@@ -0,0 +1,55 @@
+"""
+Measures the startup cost of cv_bridge.
+
+The steps timed are ``import cv_bridge``, constructing the first CvBridge, and the first
+round trip of an image through cv2_to_imgmsg and imgmsg_to_cv2.
+
+Each run starts a fresh Python process, which imports numpy before the timed steps,
+as a node that has images to convert already has. The median over the runs is reported,
+along with the cost of constructing further CvBridge instances.
+
+Usage: python3 benchmark_startup.py [--runs N]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json
+import time
+import numpy as np
+t0 = time.perf_counter()
+import cv_bridge
+t1 = time.perf_counter()
+bridge = cv_bridge.CvBridge()
+t2 = time.perf_counter()
+image = np.zeros((480, 640, 3), dtype=np.uint8)
+bridge.imgmsg_to_cv2(bridge.cv2_to_imgmsg(image, 'passthrough'), 'passthrough')
+t3 = time.perf_counter()
+for i in range(1000):
+    cv_bridge.CvBridge()
+t4 = time.perf_counter()
+print(json.dumps({'import cv_bridge': t1 - t0, 'first CvBridge()': t2 - t1,
+                  'first conversion': t3 - t2, 'further CvBridge()': (t4 - t3) / 1000}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    results = [json.loads(subprocess.check_output([sys.executable, '-c', CHILD]))
+               for _ in range(args.runs)]
+    print('median of %d runs' % args.runs)
+    for name in results[0]:
+        print('%-20s %10.3f ms' % (name, 1000.0 * statistics.median(r[name] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
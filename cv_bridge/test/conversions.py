@@ -77,6 +77,97 @@ class TestConversions(unittest.TestCase):
         self.assertTrue(msg.is_bigendian)
         self.assertTrue((br.imgmsg_to_cv2(msg) == img).all())
 
+    def test_zero_copy(self):
+        br = CvBridge()
+        img = np.random.randint(0, 255, size=(30, 40, 3)).astype(np.uint8)
+        msg = br.cv2_to_imgmsg(img, 'bgr8')
+        view = br.imgmsg_to_cv2(msg, zero_copy=True)
+        self.assertTrue((view == img).all())
+        self.assertFalse(view.flags.writeable)
+        self.assertTrue(np.shares_memory(view, np.frombuffer(msg.data, np.uint8)))
+
+        # Padded rows give a strided view instead of a copy
+        padded = np.zeros((30, 48), dtype=np.uint16)
+        padded[:, :40] = np.random.randint(0, 65535, size=(30, 40))
+        msg = br.cv2_to_imgmsg(padded, 'mono16')
+        msg.width = 40
+        view = br.imgmsg_to_cv2(msg, zero_copy=True)
+        self.assertEqual((30, 40), view.shape)
+        self.assertEqual(msg.step, view.strides[0])
+        self.assertTrue((view == padded[:, :40]).all())
+        self.assertTrue(np.shares_memory(view, np.frombuffer(msg.data, np.uint8)))
+        self.assertTrue(br.imgmsg_to_cv2(msg).flags.c_contiguous)
+
+        # Conversions still copy
+        self.assertTrue(br.imgmsg_to_cv2(msg, 'mono8', zero_copy=True).flags.writeable)
+
+        # The message encoding is not converted, with or without zero_copy
+        im = br.imgmsg_to_cv2(msg, 'mono16')
+        self.assertTrue(im.flags.c_contiguous)
+        self.assertTrue((im == padded[:, :40]).all())
+        self.assertTrue(np.shares_memory(br.imgmsg_to_cv2(msg, 'mono16', zero_copy=True),
+                                         np.frombuffer(msg.data, np.uint8)))
+
+    def test_cv2_to_imgmsg_strided(self):
+        br = CvBridge()
+        img = np.random.randint(0, 65535, size=(30, 80, 3)).astype(np.uint16)
+        roi = img[5:25, 10:50]
+        msg = br.cv2_to_imgmsg(roi)
+        self.assertEqual(40 * 3 * 2, msg.step)
+        self.assertEqual(msg.step * msg.height, len(msg.data))
+        self.assertTrue((br.imgmsg_to_cv2(msg) == roi).all())
+
+        # Images whose rows are not contiguous either
+        msg = br.cv2_to_imgmsg(img[5:25, ::2])
+        self.assertEqual(40 * 3 * 2, msg.step)
+        self.assertTrue((br.imgmsg_to_cv2(msg) == img[5:25, ::2]).all())
+        msg = br.cv2_to_imgmsg(roi)
+
+        # A message of the same size is reused
+        data = msg.data
+        self.assertIs(msg, br.cv2_to_imgmsg(img[0:20, 0:40], out=msg))
+        self.assertIs(data, msg.data)
+        self.assertTrue((br.imgmsg_to_cv2(msg) == img[0:20, 0:40]).all())
+        br.cv2_to_imgmsg(img, out=msg)
+        self.assertEqual((30, 80), (msg.height, msg.width))
+        self.assertTrue((br.imgmsg_to_cv2(msg) == img).all())
+
+    def test_imgmsg_pool(self):
+        br = CvBridge()
+        img = np.random.randint(0, 255, size=(30, 40, 3)).astype(np.uint8)
+        msg = br.acquire_imgmsg(30, 40, 'bgr8')
+        self.assertEqual((30, 40, 'bgr8', 120), (msg.height, msg.width, msg.encoding, msg.step))
+        self.assertEqual(30 * 120, len(msg.data))
+        data = msg.data
+        self.assertIs(msg, br.cv2_to_imgmsg(img, 'bgr8', out=msg))
+        self.assertIs(data, msg.data)
+        self.assertTrue((br.imgmsg_to_cv2(msg) == img).all())
+
+        br.release_imgmsg(msg)
+        self.assertIsNot(msg, br.acquire_imgmsg(30, 40, 'mono8'))
+        self.assertIs(msg, br.acquire_imgmsg(30, 40, 'bgr8'))
+        self.assertIsNot(msg, br.acquire_imgmsg(30, 40, 'bgr8'))
+
+        # Messages are reused by the layout of their data, whatever encoding they were filled with
+        msg = br.acquire_imgmsg(30, 40, 'bgr8')
+        br.cv2_to_imgmsg(img, out=msg)
+        self.assertEqual('8UC3', msg.encoding)
+        br.release_imgmsg(msg)
+        self.assertIs(msg, br.acquire_imgmsg(30, 40, 'bgr8'))
+        self.assertEqual((40, 'bgr8', 120), (msg.width, msg.encoding, msg.step))
+        br.release_imgmsg(msg)
+        self.assertIs(msg, br.acquire_imgmsg(30, 120, 'mono8'))
+        self.assertEqual((120, 'mono8', 120), (msg.width, msg.encoding, msg.step))
+        self.assertIsNot(msg, br.acquire_imgmsg(30, 40, 'mono8'))
+
+        cmprs_msg = br.acquire_compressed_imgmsg('png')
+        self.assertIs(cmprs_msg, br.cv2_to_compressed_imgmsg(img, 'png', out=cmprs_msg))
+        self.assertTrue((br.compressed_imgmsg_to_cv2(cmprs_msg) == img).all())
+        br.cv2_to_compressed_imgmsg(img[:10], 'png', out=cmprs_msg)
+        self.assertTrue((br.compressed_imgmsg_to_cv2(cmprs_msg) == img[:10]).all())
+        br.release_compressed_imgmsg(cmprs_msg)
+        self.assertIs(cmprs_msg, br.acquire_compressed_imgmsg('png'))
+
 
 if __name__ == '__main__':
 
@@ -85,4 +176,7 @@ if __name__ == '__main__':
     suite.addTest(TestConversions('test_encode_decode_cv2'))
     suite.addTest(TestConversions('test_encode_decode_cv2_compressed'))
     suite.addTest(TestConversions('test_endianness'))
+    suite.addTest(TestConversions('test_zero_copy'))
+    suite.addTest(TestConversions('test_cv2_to_imgmsg_strided'))
+    suite.addTest(TestConversions('test_imgmsg_pool'))
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -32,6 +32,28 @@ class TestEnumerants(unittest.TestCase):
         self.assertTrue(getCvType('8UC1') == cv2.CV_8UC1)
         self.assertTrue(getCvType('8U') == cv2.CV_8UC1)
 
+    def test_encoding_table(self):
+        bridge_ = CvBridge()
+        encodings = ['bgr8', 'mono8', 'rgb8', 'mono16', 'bgr16', 'rgb16', 'bgra8', 'rgba8',
+                     'bgra16', 'rgba16', 'bayer_rggb8', 'bayer_bggr16', 'yuv422', 'yuv422_yuy2',
+                     '8U', '64F', '16SC1', '32FC7']
+        for encoding in encodings:
+            cvtype = bridge_.encoding_to_cvtype2(encoding)
+            self.assertEqual(getCvType(encoding), cvtype)
+            self.assertEqual(bridge_.cvtype2_to_dtype_with_channels(cvtype),
+                             bridge_.encoding_to_dtype_with_channels(encoding))
+        self.assertEqual(('float32', 7), bridge_.encoding_to_dtype_with_channels('32FC7'))
+        self.assertRaises(CvBridgeError, lambda: bridge_.encoding_to_cvtype2('8UC'))
+        self.assertRaises(CvBridgeError, lambda: bridge_.encoding_to_cvtype2('unknown'))
+
+    def test_type_tables(self):
+        bridge_ = CvBridge()
+        self.assertIs(bridge_.cvtype_to_name, CvBridge().cvtype_to_name)
+        self.assertEqual('32FC3', bridge_.cvtype_to_name[cv2.CV_32FC3])
+        self.assertEqual('int16', bridge_.cvdepth_to_numpy_depth[cv2.CV_16S])
+        self.assertEqual('16U', bridge_.numpy_type_to_cvtype['uint16'])
+        self.assertEqual('float64', bridge_.numpy_type_to_cvtype['64F'])
+
     def test_numpy_types(self):
         bridge_ = CvBridge()
         self.assertRaises(TypeError, lambda: bridge_.cv2_to_imgmsg(1, 'rgba8'))
@@ -43,5 +65,7 @@ if __name__ == '__main__':
 
     suite = unittest.TestSuite()
     suite.addTest(TestEnumerants('test_enumerants_cv2'))
+    suite.addTest(TestEnumerants('test_encoding_table'))
+    suite.addTest(TestEnumerants('test_type_tables'))
     suite.addTest(TestEnumerants('test_numpy_types'))
     unittest.TextTestRunner(verbosity=2).run(suite)
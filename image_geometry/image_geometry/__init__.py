@@ -1,2 +1,3 @@
 from __future__ import absolute_import
 from .cameramodels import PinholeCameraModel, StereoCameraModel
+from .cameramodels import RectificationMapCache, get_rectification_map_cache
@@ -1,23 +1,308 @@
 import cv2
 import math
 import copy
+import collections
+import concurrent.futures
+import hashlib
 import numpy
 import numpy as np
+import os
+import tempfile
+import threading
+import time
 import warnings
 from deprecated.sphinx import deprecated
 
+# From sensor_msgs/distortion_models.h; any other model is handled as plumb_bob or rational_polynomial
+_EQUIDISTANT = 'equidistant'
+
 def _mkmat(rows, cols, L) -> numpy.ndarray:
     mat = np.array(L,dtype='float64')
     mat.resize(rows,cols)
     return mat
 
+def _divide_or_inf(numerator, denominator):
+    # Element-wise numerator / denominator for scalars and arrays, where a zero denominator gives inf
+    if np.isscalar(denominator):
+        if denominator == 0:
+            return float('inf')
+        return numerator / denominator
+    denominator = np.asarray(denominator)
+    dtype = np.result_type(denominator.dtype, np.float32)
+    return np.divide(numerator, denominator, out=np.full(denominator.shape, np.inf, dtype=dtype),
+                     where=denominator != 0)
+
+def _mat_changed(mat, L) -> bool:
+    # D may be empty if the camera is uncalibrated, in which case mat is None
+    if mat is None:
+        return len(L) != 0
+    return mat.size != len(L) or not np.array_equal(mat.ravel(), L)
+
+class _Cache:
+
+    """
+    Data derived from the camera parameters, such as the rectification maps.
+    Each entry is rebuilt lazily the next time it is needed after being marked dirty.
+    """
+
+    __slots__ = ('full_maps_dirty', 'full_map1', 'full_map2',
+                 'reduced_maps_dirty', 'reduced_map1', 'reduced_map2',
+                 'unrectify_full_maps_dirty', 'unrectify_full_map1', 'unrectify_full_map2',
+                 'unrectify_reduced_maps_dirty', 'unrectify_reduced_map1', 'unrectify_reduced_map2',
+                 'rectified_roi_dirty', 'rectified_roi',
+                 'ray_grid_dirty', 'ray_grid',
+                 'depth_coeffs_dirty', 'depth_coeffs')
+
+    def __init__(self):
+        self.full_maps_dirty = True
+        self.full_map1 = None
+        self.full_map2 = None
+        self.reduced_maps_dirty = True
+        self.reduced_map1 = None
+        self.reduced_map2 = None
+        self.unrectify_full_maps_dirty = True
+        self.unrectify_full_map1 = None
+        self.unrectify_full_map2 = None
+        self.unrectify_reduced_maps_dirty = True
+        self.unrectify_reduced_map1 = None
+        self.unrectify_reduced_map2 = None
+        self.rectified_roi_dirty = True
+        self.rectified_roi = None
+        self.ray_grid_dirty = True
+        self.ray_grid = None
+        self.depth_coeffs_dirty = True
+        self.depth_coeffs = None
+
+def _maps_nbytes(maps) -> int:
+    return sum(m.nbytes for m in maps if m is not None)
+
+class RectificationMapCache:
+
+    """
+    A thread-safe LRU cache of rectification maps, shared between :class:`PinholeCameraModel` instances.
+
+    Maps are keyed by a hash of the calibration, resolution, binning, ROI and map type, so that models
+    with identical parameters share one set of maps instead of each building their own.
+    Cached maps are read-only. When the total size of the cached maps exceeds the memory budget, the least
+    recently used maps are evicted; models that still reference evicted maps keep them alive.
+    The cache keeps its maps alive after the models that used them are gone, until they are evicted
+    or clear() is called.
+
+    If a directory is set, persistent maps are also saved there as ``.npy`` files, and when they are not in
+    memory they are memory-mapped from those files instead of being rebuilt. This skips building the maps when
+    a node restarts, and processes that use the same directory share the pages of the files.
+    :class:`PinholeCameraModel` only persists its full-resolution rectification maps, which depend on the
+    calibration alone, so that the directory does not grow as the ROI changes. Files are never deleted.
+
+    The process-wide instance used by :class:`PinholeCameraModel` is returned by
+    :func:`get_rectification_map_cache`. Sharing maps in memory is disabled by default; enable it with
+    ``get_rectification_map_cache().set_max_bytes(...)``.
+    """
+
+    # Bump when the layout of the files or the way the maps are built changes, so that stale files are ignored
+    FILE_FORMAT_VERSION = 1
+
+    def __init__(self, max_bytes=0, directory=None):
+        """
+        :param max_bytes: memory budget in bytes; 0, the default, disables caching in memory
+        :type max_bytes:  int
+        :param directory: directory to save maps to and load them from, or None to keep them in memory only
+        :type directory:  str
+        """
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self._max_bytes = 0
+        self._directory = None
+        self.set_max_bytes(max_bytes)
+        self.set_directory(directory)
+
+    def get(self, key, persist=False):
+        """
+        :param key:     calibration hash
+        :type key:      str
+        :param persist: whether to look for the maps in the directory too
+        :type persist:  bool
+        :rtype:         tuple or None
+
+        Returns the cached ``(map1, map2)`` pair for `key`, or None if it is not cached.
+        If `persist` is True, maps that are only on disk are memory-mapped and added to the cache.
+        """
+        with self._lock:
+            maps = self._entries.get(key)
+            if maps is not None:
+                self._entries.move_to_end(key)
+                return maps
+            directory = self._directory
+        if directory is None or not persist:
+            return None
+        maps = self._load(directory, key)
+        if maps is None:
+            return None
+        with self._lock:
+            return self._insert(key, maps)
+
+    def put(self, key, maps, persist=False):
+        """
+        :param key:     calibration hash
+        :type key:      str
+        :param maps:    ``(map1, map2)`` pair; map2 may be None
+        :type maps:     tuple
+        :param persist: whether to save the maps to the directory too
+        :type persist:  bool
+        :rtype:         tuple
+
+        Adds `maps` to the cache and returns the maps to use for `key`. If another model cached maps for
+        `key` first, those are returned instead. Maps larger than the whole budget are returned uncached.
+        If `persist` is True and a directory is set, the maps are also saved to it.
+        """
+        maps = tuple(maps)
+        with self._lock:
+            directory = self._directory
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+            maps = self._insert(key, maps)
+        if directory is not None and persist:
+            self._save(directory, key, maps)
+        return maps
+
+    def clear(self)->None:
+        """
+        Removes all maps from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def set_max_bytes(self, max_bytes)->None:
+        """
+        :param max_bytes: memory budget in bytes; 0 disables caching in memory
+        :type max_bytes:  int
+
+        Sets the memory budget, evicting the least recently used maps if the cache is now over budget.
+        """
+        if max_bytes < 0:
+            raise ValueError('max_bytes must not be negative, got %d' % max_bytes)
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def max_bytes(self)->int:
+        """ Returns the memory budget in bytes. """
+        return self._max_bytes
+
+    def set_directory(self, directory)->None:
+        """
+        :param directory: directory to save maps to and load them from, or None to keep them in memory only
+        :type directory:  str
+
+        Sets the directory for the map files, creating it if needed.
+        Maps already in memory are not saved to the new directory.
+        """
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._directory = directory
+
+    def directory(self):
+        """ Returns the directory for the map files, or None. """
+        return self._directory
+
+    def nbytes(self)->int:
+        """ Returns the total size in bytes of the cached maps. """
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, key, maps):
+        # Called with the lock held
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            return cached
+        nbytes = _maps_nbytes(maps)
+        if nbytes > self._max_bytes:
+            return maps
+        for m in maps:
+            if m is not None:
+                m.setflags(write=False)
+        self._entries[key] = maps
+        self._nbytes += nbytes
+        self._evict()
+        return maps
+
+    def _evict(self):
+        # Called with the lock held
+        while self._nbytes > self._max_bytes:
+            _, maps = self._entries.popitem(last=False)
+            self._nbytes -= _maps_nbytes(maps)
+
+    def _paths(self, directory, key):
+        prefix = os.path.join(directory, 'rectification_maps_v%d_%s' % (self.FILE_FORMAT_VERSION, key))
+        return prefix + '_map1.npy', prefix + '_map2.npy'
+
+    def _load(self, directory, key):
+        # map1 is written last, so its presence means that map2 is complete too; a missing map2 means it is None
+        path1, path2 = self._paths(directory, key)
+        if not os.path.exists(path1):
+            return None
+        try:
+            map1 = np.load(path1, mmap_mode='r')
+            map2 = np.load(path2, mmap_mode='r') if os.path.exists(path2) else None
+        except (OSError, ValueError) as e:
+            warnings.warn('Ignoring unreadable rectification map file %s: %s' % (path1, e), RuntimeWarning)
+            return None
+        # Only CV_32FC2 maps, which hold (x, y) as float32 pairs, have no map2
+        if map2 is None and not (map1.ndim == 3 and map1.dtype == np.float32):
+            return None
+        return map1, map2
+
+    def _save(self, directory, key, maps):
+        # Write to temporary files that are renamed into place, so other processes never see a partial file
+        path1, path2 = self._paths(directory, key)
+        try:
+            for path, m in ((path2, maps[1]), (path1, maps[0])):
+                if m is None:
+                    continue
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npy.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        np.save(f, m)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        except OSError as e:
+            warnings.warn('Could not save rectification maps to %s: %s' % (directory, e), RuntimeWarning)
+
+_map_cache = RectificationMapCache()
+
+def get_rectification_map_cache() -> RectificationMapCache:
+    """
+    :rtype: :class:`RectificationMapCache`
+
+    Returns the process-wide cache of rectification maps shared by all :class:`PinholeCameraModel` instances.
+    It has a memory budget of 0, so maps are only shared once a budget is set with
+    :meth:`RectificationMapCache.set_max_bytes`.
+    """
+    return _map_cache
+
 class PinholeCameraModel:
 
     """
     A pinhole camera is an idealized monocular camera.
     """
 
+    __slots__ = ('_params', '_k', '_d', '_r', '_p', '_full_k', '_full_p', '_width', '_height',
+                 '_binning_x', '_binning_y', '_distortion_model', '_raw_roi', '_tf_frame', '_stamp',
+                 '_resolution', '_map_type', '_cache')
+
     def __init__(self):
+        # K, D, R, P and the full K and P are views into _params, see _set_params()
+        self._params = None
         self._k = None
         self._d = None
         self._r = None
@@ -28,69 +313,362 @@ class PinholeCameraModel:
         self._height = None
         self._binning_x = None
         self._binning_y = None
+        self._distortion_model = None
         self._raw_roi = None
         self._tf_frame = None
         self._stamp = None
         self._resolution = None
+        self._map_type = cv2.CV_32FC1
+        self._cache = _Cache()
 
-    def from_camera_info(self, msg)->None:
+    def from_camera_info(self, msg)->bool:
         """
         :param msg: camera parameters
         :type msg:  sensor_msgs.msg.CameraInfo
+        :rtype:     bool
 
         Set the camera parameters from the :class:`sensor_msgs.msg.CameraInfo` message.
+        Returns True if the calibration, binning or ROI changed, False otherwise.
+        Parameters that are unchanged are not recomputed, so calling this with the same message on every frame is cheap.
         """
-        self._k = _mkmat(3, 3, msg.k)
-        if msg.d:
-            self._d = _mkmat(len(msg.d), 1, msg.d)
-        else:
-            self._d = None
-        self._r = _mkmat(3, 3, msg.r)
-        self._p = _mkmat(3, 4, msg.p)
-        self._full_k = _mkmat(3, 3, msg.k)
-        self._full_p = _mkmat(3, 4, msg.p)
-        self._width = msg.width
-        self._height = msg.height
-        self._binning_x = max(1, msg.binning_x)
-        self._binning_y = max(1, msg.binning_y)
-        self._resolution = (msg.width, msg.height)
-
-        self._raw_roi = copy.copy(msg.roi)
+        # Binning = 0 is considered the same as binning = 1 (no binning).
+        binning_x = max(1, msg.binning_x)
+        binning_y = max(1, msg.binning_y)
+
         # ROI all zeros is considered the same as full resolution
-        if (self._raw_roi.x_offset == 0 and self._raw_roi.y_offset == 0 and
-            self._raw_roi.width == 0 and self._raw_roi.height == 0):
-            self._raw_roi.width = self._width
-            self._raw_roi.height = self._height
+        roi = msg.roi
+        roi_width = roi.width
+        roi_height = roi.height
+        if (roi.x_offset == 0 and roi.y_offset == 0 and roi_width == 0 and roi_height == 0):
+            roi_width = msg.width
+            roi_height = msg.height
+
+        # Update time stamp (and frame_id if that changes for some reason)
         self._tf_frame = msg.header.frame_id
         self._stamp = msg.header.stamp
 
-        # Adjust K and P for binning and ROI
-        self._k[0,0] /= self._binning_x
-        self._k[1,1] /= self._binning_y
-        self._k[0,2] = (self._k[0,2] - self._raw_roi.x_offset) / self._binning_x
-        self._k[1,2] = (self._k[1,2] - self._raw_roi.y_offset) / self._binning_y
-        self._p[0,0] /= self._binning_x
-        self._p[1,1] /= self._binning_y
-        self._p[0,2] = (self._p[0,2] - self._raw_roi.x_offset) / self._binning_x
-        self._p[1,2] = (self._p[1,2] - self._raw_roi.y_offset) / self._binning_y
+        # The full calibration is invalidated by any change in the calibration parameters OR binning.
+        full_dirty = (msg.width != self._width or msg.height != self._height or
+                      msg.distortion_model != self._distortion_model or
+                      binning_x != self._binning_x or binning_y != self._binning_y or
+                      _mat_changed(self._d, msg.d) or _mat_changed(self._full_k, msg.k) or
+                      _mat_changed(self._r, msg.r) or _mat_changed(self._full_p, msg.p))
+
+        # The binning and ROI adjusted K and P are invalidated by any of the above or a change in ROI.
+        reduced_dirty = (full_dirty or self._raw_roi is None or
+                         roi.x_offset != self._raw_roi.x_offset or roi.y_offset != self._raw_roi.y_offset or
+                         roi_width != self._raw_roi.width or roi_height != self._raw_roi.height or
+                         roi.do_rectify != self._raw_roi.do_rectify)
+        if not reduced_dirty:
+            return False
+
+        if full_dirty:
+            full_k, d, r, full_p = msg.k, msg.d, msg.r, msg.p
+            self._width = msg.width
+            self._height = msg.height
+            self._binning_x = binning_x
+            self._binning_y = binning_y
+            self._distortion_model = msg.distortion_model
+            self._resolution = (msg.width, msg.height)
+            self._cache.full_maps_dirty = True
+            self._cache.unrectify_full_maps_dirty = True
 
-    def rectify_image(self, raw, rectified)->None:
-        """
-        :param raw:       input image
-        :type raw:        :class:`CvMat` or :class:`IplImage`
-        :param rectified: rectified output image
-        :type rectified:  :class:`CvMat` or :class:`IplImage`
+        else:
+            full_k, d, r, full_p = self._full_k, self._d, self._r, self._full_p
+
+        self._raw_roi = copy.copy(roi)
+        self._raw_roi.width = roi_width
+        self._raw_roi.height = roi_height
+        self._set_params(full_k, d, r, full_p)
+
+        self._cache.reduced_maps_dirty = True
+        self._cache.unrectify_reduced_maps_dirty = True
+        self._cache.rectified_roi_dirty = True
+        self._cache.ray_grid_dirty = True
+        self._cache.depth_coeffs_dirty = True
+        return True
+
+    def _set_params(self, full_k, d, r, full_p)->None:
+        # All matrices are stored in one contiguous float64 block:
+        #   [ full K (9) | full P (12) | R (9) | K (9) | P (12) | D (n) ]
+        # A new block is made whenever the parameters change, so arrays returned before stay unchanged.
+        n_d = 0 if d is None else np.size(d)
+        params = np.empty(51 + n_d, dtype='float64')
+        params[0:9] = np.ravel(full_k)
+        params[9:21] = np.ravel(full_p)
+        params[21:30] = np.ravel(r)
+        params[51:] = np.ravel(d) if n_d > 0 else ()
 
-        Applies the rectification specified by camera parameters :math:`K` and and :math:`D` to image `raw` and writes the resulting image `rectified`.
-        """
+        # Adjust K and P for binning and ROI
+        k = params[30:39].reshape(3, 3)
+        p = params[39:51].reshape(3, 4)
+        k[:] = params[0:9].reshape(3, 3)
+        p[:] = params[9:21].reshape(3, 4)
+        k[0,0] /= self._binning_x
+        k[1,1] /= self._binning_y
+        k[0,2] = (k[0,2] - self._raw_roi.x_offset) / self._binning_x
+        k[1,2] = (k[1,2] - self._raw_roi.y_offset) / self._binning_y
+        p[0,0] /= self._binning_x
+        p[1,1] /= self._binning_y
+        p[0,2] = (p[0,2] - self._raw_roi.x_offset) / self._binning_x
+        p[1,2] = (p[1,2] - self._raw_roi.y_offset) / self._binning_y
+
+        self._set_param_views(params)
+
+    def _set_param_views(self, params)->None:
+        n_d = params.size - 51
+        self._params = params
+        self._full_k = params[0:9].reshape(3, 3)
+        self._full_p = params[9:21].reshape(3, 4)
+        self._r = params[21:30].reshape(3, 3)
+        self._k = params[30:39].reshape(3, 3)
+        self._p = params[39:51].reshape(3, 4)
+        self._d = params[51:].reshape(n_d, 1) if n_d > 0 else None
+
+    def copy(self)->'PinholeCameraModel':
+        """
+        :rtype: :class:`PinholeCameraModel`
+
+        Returns a snapshot of the camera model, which is cheap to make and small enough to keep one per frame.
+        The parameters are copied into a block of a few hundred bytes, so modifying the matrices of either
+        model does not affect the other. The rectification maps and other data already derived from them are
+        shared rather than copied, since they are replaced rather than modified when the parameters change.
+        """
+        other = type(self).__new__(type(self))
+        for name in PinholeCameraModel.__slots__:
+            setattr(other, name, getattr(self, name))
+        if hasattr(self, '__dict__'):
+            other.__dict__.update(self.__dict__)
+        if self._params is not None:
+            other._set_param_views(self._params.copy())
+        other._raw_roi = copy.copy(self._raw_roi)
+        other._cache = copy.copy(self._cache)
+        return other
+
+    __copy__ = copy
+
+    def rectify_image(self, raw, rectified, interpolation=cv2.INTER_CUBIC)->None:
+        """
+        :param raw:           input image
+        :type raw:            :class:`CvMat` or :class:`IplImage`
+        :param rectified:     rectified output image
+        :type rectified:      :class:`CvMat` or :class:`IplImage`
+        :param interpolation: OpenCV interpolation method, such as ``cv2.INTER_LINEAR``
+        :type interpolation:  int
 
-        self.mapx = numpy.ndarray(shape=(self._height, self._width, 1),
-                           dtype='float32')
-        self.mapy = numpy.ndarray(shape=(self._height, self._width, 1),
-                           dtype='float32')
-        cv2.initUndistortRectifyMap(self._k, self._d, self._r, self._p,
-                (self._width, self._height), cv2.CV_32FC1, self.mapx, self.mapy)
-        cv2.remap(raw, self.mapx, self.mapy, cv2.INTER_CUBIC, rectified)
+        Applies the rectification specified by camera parameters :math:`K` and and :math:`D` to image `raw` and writes the resulting image `rectified`.
+        The equidistant (fisheye) distortion model is handled with ``cv2.fisheye``, any other model as plumb bob or rational polynomial.
+
+        `raw` must have the size reduced_resolution(), i.e. be binned and cropped to the ROI as described in the camera parameters.
+        The rectification maps are built for the full sensor at the binned resolution on the first call,
+        and cropped to the ROI. Both are reused until the camera parameters change, and the full maps
+        are kept when only the ROI changes. Their format is set with set_rectification_map_type().
+        """
+        self._init_rectification_maps()
+        cv2.remap(raw, self._cache.reduced_map1, self._cache.reduced_map2, interpolation, rectified)
+
+    def rectify_image_roi(self, raw, rect, out=None, interpolation=cv2.INTER_CUBIC)->numpy.ndarray:
+        """
+        :param raw:           input image
+        :type raw:            numpy.ndarray
+        :param rect:          region of the rectified image to compute
+        :type rect:           (x, y, width, height)
+        :param out:           optional output image of size (width, height), with the type and channels of `raw`
+        :type out:            numpy.ndarray
+        :param interpolation: OpenCV interpolation method, such as ``cv2.INTER_LINEAR``
+        :type interpolation:  int
+        :rtype:               numpy.ndarray
+
+        Returns the region `rect` of the rectification of image `raw`, as rectify_image() would compute it,
+        without remapping the rest of the image. `rect` is in the coordinates of the rectified image
+        of size reduced_resolution(), and must lie inside it.
+        """
+        x, y, width, height = rect
+        map_width, map_height = self.reduced_resolution()
+        if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > map_width or y + height > map_height:
+            raise ValueError("Rectangle %s is not inside the %dx%d rectified image" % (tuple(rect), map_width, map_height))
+        if out is not None and (out.shape[:2] != (height, width) or out.dtype != raw.dtype or out.ndim != raw.ndim):
+            raise ValueError("Output image of shape %s and type %s does not match the rectangle and the input image"
+                             % (out.shape, out.dtype))
+
+        self._init_rectification_maps()
+        rows = slice(y, y + height)
+        cols = slice(x, x + width)
+        map2 = self._cache.reduced_map2
+        if map2 is not None:
+            map2 = map2[rows, cols]
+        return cv2.remap(raw, self._cache.reduced_map1[rows, cols], map2, interpolation, out)
+
+    def set_rectification_map_type(self, map_type)->None:
+        """
+        :param map_type:  ``cv2.CV_32FC1``, ``cv2.CV_32FC2`` or ``cv2.CV_16SC2``
+        :type map_type:   int
+
+        Sets the format of the maps used by rectify_image() and unrectify_image(), as described for ``cv2.initUndistortRectifyMap``.
+        The default ``cv2.CV_32FC1`` maps are the most accurate, while fixed-point ``cv2.CV_16SC2`` maps
+        take a quarter less memory at the cost of 1/32 pixel precision, and truncate rather than round
+        the coordinates with ``cv2.INTER_NEAREST``.
+        Most of the speed up comes from the interpolation passed to rectify_image():
+        ``cv2.INTER_LINEAR`` and ``cv2.INTER_NEAREST`` are several times faster than the default ``cv2.INTER_CUBIC``.
+        See test/benchmark_rectify.py for a comparison.
+        """
+        if map_type not in (cv2.CV_32FC1, cv2.CV_32FC2, cv2.CV_16SC2):
+            raise ValueError("Unsupported rectification map type %d" % map_type)
+        if map_type != self._map_type:
+            self._map_type = map_type
+            self._cache.full_maps_dirty = True
+            self._cache.reduced_maps_dirty = True
+            self._cache.unrectify_full_maps_dirty = True
+            self._cache.unrectify_reduced_maps_dirty = True
+
+    def rectification_map_type(self)->int:
+        """
+        :rtype:           int
+
+        Returns the format of the maps used by rectify_image() and unrectify_image(), see set_rectification_map_type()
+        """
+        return self._map_type
+
+    def _init_rectification_maps(self)->None:
+        if self._cache.full_maps_dirty:
+            key = self._map_cache_key('rectify', reduced=False)
+            maps = _map_cache.get(key, persist=True)
+            if maps is None:
+                # Create the full-size map at the binned resolution
+                k_binned, p_binned = self._binned_matrices()
+                if self._distortion_model == _EQUIDISTANT:
+                    # cv2.fisheye only builds CV_32FC1 and CV_16SC2 maps
+                    fisheye_map_type = cv2.CV_32FC1 if self._map_type == cv2.CV_32FC2 else self._map_type
+                    maps = cv2.fisheye.initUndistortRectifyMap(
+                        k_binned, self._fisheye_d(), self._r, p_binned, self._binned_resolution(), fisheye_map_type)
+                    if fisheye_map_type != self._map_type:
+                        maps = cv2.convertMaps(maps[0], maps[1], self._map_type)
+                else:
+                    maps = cv2.initUndistortRectifyMap(
+                        k_binned, self._d, self._r, p_binned, self._binned_resolution(), self._map_type)
+                maps = _map_cache.put(key, maps, persist=True)
+            self._cache.full_map1, self._cache.full_map2 = maps
+            self._cache.full_maps_dirty = False
+
+        if self._cache.reduced_maps_dirty:
+            self._cache.reduced_map1, self._cache.reduced_map2 = self._cached_reduce_maps(
+                'rectify', self._cache.full_map1, self._cache.full_map2)
+            self._cache.reduced_maps_dirty = False
+
+    def _map_cache_key(self, kind, reduced)->str:
+        # Hash of everything the maps depend on, for lookups in the shared map cache
+        # The OpenCV version is included since maps may be saved to disk and loaded by another build.
+        h = hashlib.sha1()
+        h.update(repr((cv2.__version__, kind, self._map_type, self._distortion_model, self._width, self._height,
+                       self._binning_x, self._binning_y)).encode())
+        for mat in (self._full_k, self._d, self._r, self._full_p):
+            h.update(b'none' if mat is None else np.ascontiguousarray(mat, dtype='float64').tobytes())
+        if reduced:
+            roi = self._raw_roi
+            h.update(repr((roi.x_offset, roi.y_offset, roi.width, roi.height)).encode())
+        return h.hexdigest()
+
+    def _cached_reduce_maps(self, kind, map1, map2):
+        if self._is_full_roi():
+            return map1, map2
+        key = self._map_cache_key(kind, reduced=True)
+        maps = _map_cache.get(key)
+        if maps is None:
+            maps = _map_cache.put(key, self._reduce_maps(map1, map2))
+        return maps
+
+    def _is_full_roi(self)->bool:
+        roi = self._raw_roi
+        return (roi.x_offset == 0 and roi.y_offset == 0 and
+                roi.width == self._width and roi.height == self._height)
+
+    def _binned_resolution(self)->tuple[int, int]:
+        return (self._width // self._binning_x, self._height // self._binning_y)
+
+    def _binned_matrices(self)->tuple[numpy.ndarray, numpy.ndarray]:
+        # K and P with binning applied, but not cropping
+        k_binned = self._full_k.copy()
+        p_binned = self._full_p.copy()
+        k_binned[0] /= self._binning_x
+        k_binned[1] /= self._binning_y
+        p_binned[0] /= self._binning_x
+        p_binned[1] /= self._binning_y
+        return k_binned, p_binned
+
+    def _reduce_maps(self, map1, map2):
+        roi = self._raw_roi
+        if self._is_full_roi():
+            # We're remapping the full image
+            return map1, map2
+
+        # Crop the maps to the binned ROI. The maps hold pixel coordinates, which we adjust by the ROI offset;
+        # the LUT indices for subpixel interpolation of fixed-point maps can be left as-is.
+        x = roi.x_offset // self._binning_x
+        y = roi.y_offset // self._binning_y
+        rows = slice(y, y + roi.height // self._binning_y)
+        cols = slice(x, x + roi.width // self._binning_x)
+        if self._map_type == cv2.CV_32FC1:
+            return map1[rows, cols] - x, map2[rows, cols] - y
+        map1 = map1[rows, cols] - np.array([x, y], dtype=map1.dtype)
+        if map2 is not None:
+            map2 = map2[rows, cols]
+        return map1, map2
+
+    def unrectify_image(self, rectified, raw, interpolation=cv2.INTER_CUBIC)->None:
+        """
+        :param rectified:     rectified input image
+        :type rectified:      :class:`CvMat` or :class:`IplImage`
+        :param raw:           output image
+        :type raw:            :class:`CvMat` or :class:`IplImage`
+        :param interpolation: OpenCV interpolation method, such as ``cv2.INTER_LINEAR``
+        :type interpolation:  int
+
+        Applies the inverse of the rectification specified by camera parameters :math:`K` and :math:`D` to image `rectified`
+        and writes the resulting image `raw`. This is the inverse of rectify_image().
+
+        The unrectification maps are built and cached like the rectification maps of rectify_image().
+        """
+        self._init_unrectification_maps()
+        cv2.remap(rectified, self._cache.unrectify_reduced_map1, self._cache.unrectify_reduced_map2, interpolation, raw)
+
+    def _init_unrectification_maps(self)->None:
+        if self._cache.unrectify_full_maps_dirty:
+            key = self._map_cache_key('unrectify', reduced=False)
+            maps = _map_cache.get(key)
+            if maps is None:
+                # Create the full-size map at the binned resolution.
+                # Each raw pixel samples the rectified image at the position it rectifies to.
+                k_binned, p_binned = self._binned_matrices()
+                width, height = self._binned_resolution()
+                u, v = np.meshgrid(np.arange(width, dtype='float64'), np.arange(height, dtype='float64'))
+                uv_raw = np.stack((u, v), axis=-1).reshape(-1, 1, 2)
+                uv_rect = self._undistort_points(uv_raw, k_binned, p_binned)
+                map_x = uv_rect[:, 0, 0].astype('float32').reshape(height, width)
+                map_y = uv_rect[:, 0, 1].astype('float32').reshape(height, width)
+                if self._map_type == cv2.CV_32FC1:
+                    maps = (map_x, map_y)
+                else:
+                    maps = cv2.convertMaps(map_x, map_y, self._map_type)
+                maps = _map_cache.put(key, maps)
+            self._cache.unrectify_full_map1, self._cache.unrectify_full_map2 = maps
+            self._cache.unrectify_full_maps_dirty = False
+
+        if self._cache.unrectify_reduced_maps_dirty:
+            self._cache.unrectify_reduced_map1, self._cache.unrectify_reduced_map2 = self._cached_reduce_maps(
+                'unrectify', self._cache.unrectify_full_map1, self._cache.unrectify_full_map2)
+            self._cache.unrectify_reduced_maps_dirty = False
+
+    def _undistort_points(self, src, k, p, dst=None)->numpy.ndarray:
+        # src and dst are (N, 1, 2) arrays
+        if self._distortion_model == _EQUIDISTANT:
+            return cv2.fisheye.undistortPoints(src, k, self._fisheye_d(), dst, R=self._r, P=p)
+        return cv2.undistortPoints(src, k, self._d, dst, R=self._r, P=p)
+
+    def _fisheye_d(self)->numpy.ndarray:
+        # cv2.fisheye requires the 4 distortion coefficients even when there is no distortion
+        if self._d is None:
+            return np.zeros((4, 1))
+        return self._d
 
     def rectify_point(self, uv_raw)->numpy.ndarray:
         """
@@ -105,9 +683,71 @@ class PinholeCameraModel:
 
         src = _mkmat(1, 2, list(uv_raw))
         src.resize((1,1,2))
-        dst = cv2.undistortPoints(src, self._k, self._d, R=self._r, P=self._p)
+        dst = self._undistort_points(src, self._k, self._p)
         return dst[0,0]
-    
+
+    def rectify_points(self, uv_raw, out=None)->numpy.ndarray:
+        """
+        :param uv_raw:    pixel coordinates, one (u, v) row per point
+        :type uv_raw:     numpy.ndarray of shape (N, 2)
+        :param out:       optional preallocated output array
+        :type out:        C-contiguous numpy.ndarray of shape (N, 2) and dtype float64
+        :rtype:           numpy.ndarray
+
+        Applies the rectification specified by camera parameters
+        :math:`K` and and :math:`D` to all points in `uv_raw` with a single
+        OpenCV call and returns an (N, 2) array of rectified pixel coordinates.
+        This is the batch version of rectify_point().
+        """
+        src = np.asarray(uv_raw, dtype='float64').reshape(-1, 1, 2)
+        if out is None:
+            out = np.empty((src.shape[0], 2), dtype='float64')
+        elif out.shape != (src.shape[0], 2) or out.dtype != np.float64 or not out.flags.c_contiguous:
+            raise ValueError("out must be a C-contiguous float64 array of shape (%d, 2)" % src.shape[0])
+        if src.shape[0] > 0:
+            self._undistort_points(src, self._k, self._p, out.reshape(-1, 1, 2))
+        return out
+
+    def unrectify_point(self, uv_rect)->numpy.ndarray:
+        """
+        :param uv_rect:   rectified pixel coordinates
+        :type uv_rect:    (u, v)
+        :rtype:           numpy.ndarray
+
+        Applies the distortion specified by camera parameters :math:`K` and :math:`D` to the rectified
+        point (u, v) and returns the pixel coordinates of the raw point.
+        This is the inverse of rectify_point().
+        """
+        return self.unrectify_points([uv_rect])[0]
+
+    def unrectify_points(self, uv_rect)->numpy.ndarray:
+        """
+        :param uv_rect:   rectified pixel coordinates, one (u, v) row per point
+        :type uv_rect:    numpy.ndarray of shape (N, 2)
+        :rtype:           numpy.ndarray
+
+        Applies the distortion specified by camera parameters :math:`K` and :math:`D` to all points
+        in `uv_rect` with a single OpenCV call and returns an (N, 2) array of raw pixel coordinates.
+        This is the batch version of unrectify_point(), and the inverse of rectify_points().
+        """
+        uv_rect = np.asarray(uv_rect, dtype='float64').reshape(-1, 2)
+        if uv_rect.shape[0] == 0:
+            return np.empty((0, 2))
+
+        # Convert to rays
+        rays = np.ones((uv_rect.shape[0], 1, 3))
+        rays[:, 0, 0] = (uv_rect[:, 0] - self.cx() - self.tx()) / self.fx()
+        rays[:, 0, 1] = (uv_rect[:, 1] - self.cy() - self.ty()) / self.fy()
+
+        # Project the rays on the image
+        r_vec, _ = cv2.Rodrigues(self._r.T)
+        t_vec = np.zeros((3, 1))
+        if self._distortion_model == _EQUIDISTANT:
+            uv_raw, _ = cv2.fisheye.projectPoints(rays, r_vec, t_vec, self._k, self._fisheye_d())
+        else:
+            uv_raw, _ = cv2.projectPoints(rays, r_vec, t_vec, self._k, self._d)
+        return uv_raw.reshape(-1, 2)
+
     def project_3d_to_pixel(self, point)->tuple[float,float]:
         """
         :param point:     3D point
@@ -127,7 +767,76 @@ class PinholeCameraModel:
             return (x / w, y / w)
         else:
             return (float('nan'), float('nan'))
-    
+
+    def project_3d_to_pixels(self, points, return_mask=False):
+        """
+        :param points:      3D points, one (x, y, z) row per point
+        :type points:       numpy.ndarray of shape (N, 3)
+        :param return_mask: whether to also return which points are visible in the image
+        :type return_mask:  bool
+        :rtype:             numpy.ndarray, or tuple[numpy.ndarray, numpy.ndarray] if return_mask is True
+
+        Returns an (N, 2) array with the rectified pixel coordinates (u, v) of the 3D points,
+        using the camera :math:`P` matrix. Points for which w == 0 get NaN coordinates.
+        This is the batch version of project_3d_to_pixel().
+
+        If `return_mask` is True, a boolean mask of shape (N,) is returned as well, which is set for
+        the points in front of the camera (w > 0) that fall inside the image of size reduced_resolution().
+        """
+        uvw = self._project_homogeneous(points)
+        w = uvw[:, 2:]
+        uv = np.full((uvw.shape[0], 2), np.nan)
+        np.divide(uvw[:, :2], w, out=uv, where=w != 0)
+        if not return_mask:
+            return uv
+
+        width, height = self.reduced_resolution()
+        mask = w[:, 0] > 0
+        mask &= (uv[:, 0] >= 0) & (uv[:, 0] < width)
+        mask &= (uv[:, 1] >= 0) & (uv[:, 1] < height)
+        return uv, mask
+
+    def _project_homogeneous(self, points)->numpy.ndarray:
+        # (N, 3) homogeneous pixel coordinates (u*w, v*w, w) of the points, using P
+        points = np.asarray(points, dtype='float64').reshape(-1, 3)
+        uvw = points @ self._p[:, :3].T
+        uvw += self._p[:, 3]
+        return uvw
+
+    def in_frustum(self, points, near=0.0, far=float('inf'), return_pixels=False):
+        """
+        :param points:        3D points, one (x, y, z) row per point
+        :type points:         numpy.ndarray of shape (N, 3)
+        :param near:          minimum depth of the visible points
+        :type near:           float
+        :param far:           maximum depth of the visible points
+        :type far:            float
+        :param return_pixels: whether to also return the pixel coordinates of the visible points
+        :type return_pixels:  bool
+        :rtype:               numpy.ndarray, or tuple[numpy.ndarray, numpy.ndarray] if return_pixels is True
+
+        Returns a boolean mask of shape (N,) which is set for the points inside the view frustum of the camera:
+        in front of the camera with a depth in [`near`, `far`], and projecting into the image of size
+        reduced_resolution(), so the ROI and binning are taken into account. The depth is w, the third coordinate
+        of the projection with the camera :math:`P` matrix, which is z for points in the rectified camera frame.
+
+        The image bounds are checked on the homogeneous coordinates, so only the visible points are divided by w.
+        If `return_pixels` is True, an (M, 2) array with the rectified pixel coordinates (u, v) of the M visible
+        points is returned as well, in the same order as the points.
+        Without depth limits, this is the mask of project_3d_to_pixels() with `return_mask`.
+        """
+        uvw = self._project_homogeneous(points)
+        u, v, w = uvw[:, 0], uvw[:, 1], uvw[:, 2]
+        width, height = self.reduced_resolution()
+        # For w > 0, 0 <= u / w < width is equivalent to 0 <= u < width * w
+        mask = (w > 0) & (w >= near) & (w <= far)
+        mask &= (u >= 0) & (u < width * w)
+        mask &= (v >= 0) & (v < height * w)
+        if not return_pixels:
+            return mask
+        visible = uvw[mask]
+        return mask, visible[:, :2] / visible[:, 2:]
+
     def project_pixel_to_3d_ray(self, uv)->tuple[float,float,float]:
         """
         :param uv:        rectified pixel coordinates
@@ -146,6 +855,108 @@ class PinholeCameraModel:
         z = 1.0 / norm
         return (x, y, z)
 
+    def project_pixels_to_3d_rays(self, uv)->numpy.ndarray:
+        """
+        :param uv:        rectified pixel coordinates, one (u, v) row per pixel
+        :type uv:         numpy.ndarray of shape (N, 2)
+        :rtype:           numpy.ndarray
+
+        Returns an (N, 3) array with the unit vectors which pass from the camera center through the rectified pixels,
+        using the camera :math:`P` matrix.
+        This is the batch version of project_pixel_to_3d_ray().
+        """
+        uv = np.asarray(uv, dtype='float64').reshape(-1, 2)
+        rays = np.empty((uv.shape[0], 3))
+        rays[:, 0] = (uv[:, 0] - self.cx()) / self.fx()
+        rays[:, 1] = (uv[:, 1] - self.cy()) / self.fy()
+        rays[:, 2] = 1.0
+        rays /= np.sqrt(np.einsum('ij,ij->i', rays, rays))[:, np.newaxis]
+        return rays
+
+    def ray_grid(self)->numpy.ndarray:
+        """
+        :rtype:           numpy.ndarray
+
+        Returns a read-only (height, width, 3) float32 array holding the unit vector through every pixel
+        of the rectified image of size reduced_resolution(), as given by project_pixel_to_3d_ray().
+        The grid is built on the first call and reused until the camera parameters change,
+        so that e.g. a range image can be turned into points with a single multiplication.
+        """
+        if self._cache.ray_grid_dirty:
+            width, height = self.reduced_resolution()
+            x = (np.arange(width) - self.cx()) / self.fx()
+            y = (np.arange(height) - self.cy()) / self.fy()
+            norm = np.sqrt(x[np.newaxis, :] ** 2 + y[:, np.newaxis] ** 2 + 1)
+            grid = np.empty((height, width, 3), dtype='float32')
+            grid[:, :, 0] = x[np.newaxis, :] / norm
+            grid[:, :, 1] = y[:, np.newaxis] / norm
+            grid[:, :, 2] = 1.0 / norm
+            grid.setflags(write=False)
+            self._cache.ray_grid = grid
+            self._cache.ray_grid_dirty = False
+        return self._cache.ray_grid
+
+    def depth_to_points(self, depth, stride=1, colors=None, remove_invalid=True):
+        """
+        :param depth:           rectified depth image, as returned by :meth:`cv_bridge.CvBridge.imgmsg_to_cv2`
+        :type depth:            numpy.ndarray of shape (height, width), uint16 in millimetres or float in metres
+        :param stride:          only convert every `stride`-th pixel along each axis
+        :type stride:           int
+        :param colors:          optional image of the same size whose pixels are attached to the points
+        :type colors:           numpy.ndarray of shape (height, width) or (height, width, channels)
+        :param remove_invalid:  whether to drop pixels with zero or NaN depth
+        :type remove_invalid:   bool
+        :rtype:                 numpy.ndarray, or tuple[numpy.ndarray, numpy.ndarray] if `colors` is given
+
+        Converts a depth image, holding the Z coordinate of each pixel as described in REP 118,
+        into float32 3D points (x, y, z) in the camera frame, using the camera :math:`P` matrix.
+        The depth image must have the size reduced_resolution().
+
+        If `remove_invalid` is True, an (N, 3) array with the valid points only is returned, and the colors
+        are returned as an (N, channels) array. Otherwise the points are returned as an organized
+        (height, width, 3) array with NaN for invalid pixels, along with the colors as given.
+        Both are subsampled by `stride`.
+
+        The per-pixel ray coefficients are computed once and reused until the camera parameters change.
+        """
+        width, height = self.reduced_resolution()
+        if depth.shape[:2] != (height, width):
+            raise ValueError("Depth image of shape %s does not match the camera resolution %dx%d" % (depth.shape, width, height))
+        if colors is not None and colors.shape[:2] != depth.shape[:2]:
+            raise ValueError("Color image of shape %s does not match the depth image of shape %s" % (colors.shape, depth.shape))
+
+        if self._cache.depth_coeffs_dirty:
+            self._cache.depth_coeffs = (((np.arange(width) - self.cx()) / self.fx()).astype('float32'),
+                                        ((np.arange(height) - self.cy()) / self.fy()).astype('float32'))
+            self._cache.depth_coeffs_dirty = False
+        coeff_x, coeff_y = self._cache.depth_coeffs
+
+        depth = depth[::stride, ::stride]
+        if depth.dtype == np.uint16:
+            z = depth * np.float32(0.001)
+        elif np.issubdtype(depth.dtype, np.floating):
+            z = depth.astype('float32', copy=False)
+        else:
+            raise ValueError("Unsupported depth image type %s, expected uint16 or float" % depth.dtype)
+        valid = np.isfinite(z) & (z > 0)
+
+        points = np.empty(z.shape + (3,), dtype='float32')
+        np.multiply(z, coeff_x[np.newaxis, ::stride], out=points[:, :, 0])
+        np.multiply(z, coeff_y[::stride, np.newaxis], out=points[:, :, 1])
+        points[:, :, 2] = z
+
+        if colors is not None:
+            colors = colors[::stride, ::stride]
+        if remove_invalid:
+            points = points[valid]
+            if colors is not None:
+                colors = colors[valid].reshape(points.shape[0], -1)
+        else:
+            points[~valid] = np.nan
+        if colors is not None:
+            return points, colors
+        return points
+
     def get_delta_u(self, delta_x, z)->float:
         """
         :param delta_x:         delta X, in cartesian space
@@ -212,6 +1023,105 @@ class PinholeCameraModel:
         """
         return self._resolution
 
+    def reduced_resolution(self)->tuple[int, int]:
+        """
+        :rtype:                 tuple[int, int]
+
+        Returns the resolution of the images produced by the camera, after applying binning and ROI,
+        as a tuple in the format (width, height)
+        """
+        return (self._raw_roi.width // self._binning_x, self._raw_roi.height // self._binning_y)
+
+    def to_full_resolution(self, uv_reduced)->numpy.ndarray:
+        """
+        :param uv_reduced:      pixel coordinates in the reduced resolution image
+        :type uv_reduced:       (u, v) or numpy.ndarray of shape (N, 2)
+        :rtype:                 numpy.ndarray
+
+        Converts pixel coordinates of the reduced resolution image, i.e. after binning and ROI,
+        to pixel coordinates of the full resolution image, using the rectified ROI.
+        This is the inverse of to_reduced_resolution().
+        """
+        x, y, _, _ = self.rectified_roi()
+        return np.asarray(uv_reduced, dtype='float64') * (self._binning_x, self._binning_y) + (x, y)
+
+    def to_reduced_resolution(self, uv_full)->numpy.ndarray:
+        """
+        :param uv_full:         pixel coordinates in the full resolution image
+        :type uv_full:          (u, v) or numpy.ndarray of shape (N, 2)
+        :rtype:                 numpy.ndarray
+
+        Converts pixel coordinates of the full resolution image to pixel coordinates of the
+        reduced resolution image, i.e. after binning and ROI, using the rectified ROI.
+        This is the inverse of to_full_resolution().
+        """
+        x, y, _, _ = self.rectified_roi()
+        return (np.asarray(uv_full, dtype='float64') - (x, y)) / (self._binning_x, self._binning_y)
+
+    def to_full_resolution_rect(self, rect_reduced)->numpy.ndarray:
+        """
+        :param rect_reduced:    rectangles in the reduced resolution image
+        :type rect_reduced:     (x, y, width, height) or numpy.ndarray of shape (N, 4)
+        :rtype:                 numpy.ndarray
+
+        Converts rectangles, such as bounding boxes, of the reduced resolution image to rectangles of the
+        full resolution image. This is the inverse of to_reduced_resolution_rect().
+        """
+        x, y, _, _ = self.rectified_roi()
+        binning = (self._binning_x, self._binning_y, self._binning_x, self._binning_y)
+        return np.asarray(rect_reduced, dtype='int64') * binning + (x, y, 0, 0)
+
+    def to_reduced_resolution_rect(self, rect_full)->numpy.ndarray:
+        """
+        :param rect_full:       rectangles in the full resolution image
+        :type rect_full:        (x, y, width, height) or numpy.ndarray of shape (N, 4)
+        :rtype:                 numpy.ndarray
+
+        Converts rectangles, such as bounding boxes, of the full resolution image to rectangles of the
+        reduced resolution image. This is the inverse of to_full_resolution_rect().
+        """
+        x, y, _, _ = self.rectified_roi()
+        binning = (self._binning_x, self._binning_y, self._binning_x, self._binning_y)
+        return (np.asarray(rect_full, dtype='int64') - (x, y, 0, 0)) // binning
+
+    def rectified_roi(self)->tuple[int, int, int, int]:
+        """
+        :rtype:                 tuple[int, int, int, int]
+
+        Returns the ROI of the rectified image in full resolution coordinates, as (x, y, width, height).
+        This is the raw ROI, rectified with rectify_roi() if its do_rectify flag is set.
+        The result is cached until the camera parameters change.
+        """
+        if self._cache.rectified_roi_dirty:
+            roi = self._raw_roi
+            raw_roi = (roi.x_offset, roi.y_offset, roi.width, roi.height)
+            if roi.do_rectify:
+                self._cache.rectified_roi = self.rectify_roi(raw_roi)
+            else:
+                self._cache.rectified_roi = raw_roi
+            self._cache.rectified_roi_dirty = False
+        return self._cache.rectified_roi
+
+    def rectify_roi(self, roi_raw)->tuple[int, int, int, int]:
+        """
+        :param roi_raw:         ROI in raw full resolution coordinates
+        :type roi_raw:          (x, y, width, height)
+        :rtype:                 tuple[int, int, int, int]
+
+        Returns the largest rectangle inside the rectification of `roi_raw`, as (x, y, width, height)
+        in full resolution coordinates.
+        """
+        # For now, just rectify the four corners and take the bounding box, as in the C++ implementation.
+        # Since ROI is specified in unbinned coordinates (see REP-104), this has to use the full K and P.
+        x, y, width, height = roi_raw
+        corners = np.array([[x, y], [x + width, y], [x + width, y + height], [x, y + height]], dtype='float64')
+        tl, tr, br, bl = self._undistort_points(corners.reshape(-1, 1, 2), self._full_k, self._full_p)[:, 0]
+        roi_x = int(math.ceil(min(tl[0], bl[0])))
+        roi_y = int(math.ceil(min(tl[1], tr[1])))
+        return (roi_x, roi_y,
+                int(math.floor(max(tr[0], br[0]))) - roi_x,
+                int(math.floor(max(bl[1], br[1]))) - roi_y)
+
     def intrinsic_matrix(self)->numpy.ndarray:
         """ 
         :rtype:                 numpy.ndarray
@@ -492,17 +1402,19 @@ class PinholeCameraModel:
         return self.fov_y()
 
     @deprecated(version="J-turtle", reason="The fromCameraInfo() method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the from_camera_info() method instead.")
-    def fromCameraInfo(self,msg)->None:
+    def fromCameraInfo(self,msg)->bool:
         """
         .. warning::
             The fromCameraInfo() method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the from_camera_info() method instead.
 
         :param msg: camera parameters
         :type msg:  sensor_msgs.msg.CameraInfo
+        :rtype:     bool
         
         Set the camera parameters from the :class:`sensor_msgs.msg.CameraInfo` message.
+        Returns True if the calibration, binning or ROI changed, False otherwise.
         """
-        self.from_camera_info(msg)
+        return self.from_camera_info(msg)
 
     @deprecated(version="J-turtle", reason="The fullIntrinsicMatrix()->numpy.matrix method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the full_intrinsic_matrix()->numpy.ndarray method instead.")
     def fullIntrinsicMatrix(self) -> numpy.matrix:
@@ -755,18 +1667,28 @@ class StereoCameraModel:
         self._left = PinholeCameraModel()
         self._right = PinholeCameraModel()
         self._q = None
+        self._tx = None
+        self._rectified_pair = [None, None]
+        self._executor = None
+        self._stereo_matcher = None
+        self._disparity_buffers = {}
+        self._timings = {}
     
-    def from_camera_info(self, left_msg, right_msg):
+    def from_camera_info(self, left_msg, right_msg)->bool:
         """
         :param left_msg: left camera parameters
         :type left_msg:  sensor_msgs.msg.CameraInfo
         :param right_msg: right camera parameters
         :type right_msg:  sensor_msgs.msg.CameraInfo
+        :rtype:           bool
 
         Set the camera parameters from the :class:`sensor_msgs.msg.CameraInfo` messages.
+        Returns True if the parameters of either camera changed, False otherwise.
         """
-        self._left.from_camera_info(left_msg)
-        self._right.from_camera_info(right_msg)
+        left_changed = self._left.from_camera_info(left_msg)
+        right_changed = self._right.from_camera_info(right_msg)
+        if not right_changed and self._q is not None:
+            return left_changed
 
         # [ Fx, 0,  Cx,  Fx*-Tx ]
         # [ 0,  Fy, Cy,  0      ]
@@ -792,6 +1714,191 @@ class StereoCameraModel:
         self._q[2, 3] = fx
         self._q[3, 2] = 1 / tx
 
+        # Fx * baseline, which relates disparity and depth
+        self._tx = -self._right.projection_matrix()[0, 3]
+        return True
+
+    def rectify_pair(self, left_raw, right_raw, interpolation=cv2.INTER_CUBIC, parallel=False)->tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :param left_raw:      left input image
+        :type left_raw:       numpy.ndarray
+        :param right_raw:     right input image
+        :type right_raw:      numpy.ndarray
+        :param interpolation: OpenCV interpolation method, such as ``cv2.INTER_LINEAR``
+        :type interpolation:  int
+        :param parallel:      whether to rectify the two images concurrently
+        :type parallel:       bool
+        :rtype:               tuple[numpy.ndarray, numpy.ndarray]
+
+        Rectifies a synchronized stereo pair with each camera's rectify_image(), and returns the rectified
+        images as (left_rectified, right_rectified). The rectification maps of both cameras are cached.
+
+        The returned images are buffers owned by this model, which are reused and overwritten by the next call
+        with images of the same size and type; copy them to keep them.
+        If `parallel` is True, the right image is rectified on a worker thread while the left one is rectified
+        on the calling thread. ``cv2.remap`` releases the GIL, so this helps when OpenCV's own threading
+        is disabled or the images are small. The worker thread is stopped by close().
+        """
+        # Build the maps up front, so that the worker thread only reads them
+        self._left._init_rectification_maps()
+        self._right._init_rectification_maps()
+        left_rectified = self._rectified_buffer(0, left_raw)
+        right_rectified = self._rectified_buffer(1, right_raw)
+        if parallel:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            right_done = self._executor.submit(self._right.rectify_image, right_raw, right_rectified, interpolation)
+            self._left.rectify_image(left_raw, left_rectified, interpolation)
+            right_done.result()
+        else:
+            self._left.rectify_image(left_raw, left_rectified, interpolation)
+            self._right.rectify_image(right_raw, right_rectified, interpolation)
+        return left_rectified, right_rectified
+
+    def close(self)->None:
+        """
+        Shuts down the worker thread started by rectify_pair() with `parallel`, if any.
+        The model can still be used afterwards, and starts a new worker thread when needed.
+        It is also closed when used as a context manager, or garbage collected.
+        """
+        executor = getattr(self, '_executor', None)
+        if executor is not None:
+            self._executor = None
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def set_stereo_matcher(self, matcher)->None:
+        """
+        :param matcher: stereo matcher, or None for the default
+        :type matcher:  ``cv2.StereoMatcher``
+
+        Sets the matcher used by compute_disparity(), such as one made with ``cv2.StereoSGBM_create`` or
+        ``cv2.StereoBM_create``. The default is a semi-global block matcher for 64 disparities.
+        """
+        self._stereo_matcher = matcher
+
+    def stereo_matcher(self):
+        """
+        :rtype: ``cv2.StereoMatcher``
+
+        Returns the matcher used by compute_disparity(), creating the default one if none was set.
+        """
+        if self._stereo_matcher is None:
+            block_size = 5
+            self._stereo_matcher = cv2.StereoSGBM_create(
+                minDisparity=0, numDisparities=64, blockSize=block_size,
+                P1=8 * block_size * block_size, P2=32 * block_size * block_size,
+                uniquenessRatio=10, speckleWindowSize=100, speckleRange=2,
+                mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+        return self._stereo_matcher
+
+    def compute_disparity(self, left_raw, right_raw, scale=1.0, parallel=False)->numpy.ndarray:
+        """
+        :param left_raw:  left input image, grayscale or BGR
+        :type left_raw:   numpy.ndarray
+        :param right_raw: right input image, grayscale or BGR
+        :type right_raw:  numpy.ndarray
+        :param scale:     factor in (0, 1] to downscale the rectified images by before matching
+        :type scale:      float
+        :param parallel:  whether to rectify the two images concurrently, see rectify_pair()
+        :type parallel:   bool
+        :rtype:           numpy.ndarray
+
+        Returns the float32 disparity image of the rectified left camera, in pixels, for a raw stereo pair.
+        The images are rectified with rectify_pair() using linear interpolation, converted to grayscale, optionally downscaled and matched
+        with stereo_matcher(). The disparity has the size of the rectified images and is in full-resolution pixels,
+        so it can be passed directly to disparity_to_points() and get_z(). Pixels without a match are NaN.
+
+        With a `scale` below 1 matching is faster, and the disparity is upsampled with nearest-neighbour
+        interpolation, so that disparities are not blended across object boundaries. The matcher's
+        disparity range then applies to the downscaled images, and covers 1/`scale` times more full-resolution pixels.
+
+        The returned image is a buffer owned by this model, which is reused and overwritten by the next call;
+        copy it to keep it. The time spent in each stage of the last call is returned by last_timings().
+        """
+        if not 0 < scale <= 1:
+            raise ValueError('scale must be in (0, 1], got %r' % scale)
+        t_start = time.perf_counter()
+        left, right = self.rectify_pair(left_raw, right_raw, cv2.INTER_LINEAR, parallel)
+
+        t_rectified = time.perf_counter()
+        left = self._gray(left, 'left_gray')
+        right = self._gray(right, 'right_gray')
+
+        t_converted = time.perf_counter()
+
+        height, width = left.shape
+        if scale != 1:
+            size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            left = cv2.resize(left, size, self._disparity_buffer('left_small', size[::-1], left.dtype),
+                              interpolation=cv2.INTER_AREA)
+            right = cv2.resize(right, size, self._disparity_buffer('right_small', size[::-1], right.dtype),
+                               interpolation=cv2.INTER_AREA)
+
+        t_resized = time.perf_counter()
+        matcher = self.stereo_matcher()
+        fixed = matcher.compute(left, right, self._disparity_buffer('fixed', left.shape, np.int16))
+
+        t_matched = time.perf_counter()
+        # The matcher returns fixed-point disparities with 4 fractional bits, and minDisparity - 1 for no match.
+        # Rescale by the width actually matched, which is rounded from width * scale.
+        small = self._disparity_buffer('small', fixed.shape, np.float32)
+        np.multiply(fixed, np.float32(width / (16.0 * fixed.shape[1])), out=small)
+        small[fixed < matcher.getMinDisparity() * 16] = np.nan
+        if scale != 1:
+            disparity = cv2.resize(small, (width, height), self._disparity_buffer('disparity', (height, width), np.float32),
+                                   interpolation=cv2.INTER_NEAREST)
+        else:
+            disparity = small
+
+        t_end = time.perf_counter()
+        self._timings = {
+            'rectify': t_rectified - t_start,
+            'convert': t_converted - t_rectified,
+            'resize': t_resized - t_converted,
+            'match': t_matched - t_resized,
+            'postprocess': t_end - t_matched,
+            'total': t_end - t_start,
+        }
+        return disparity
+
+    def last_timings(self)->dict:
+        """
+        :rtype: dict
+
+        Returns the time in seconds spent in each stage of the last compute_disparity() call,
+        keyed by ``'rectify'``, ``'convert'``, ``'resize'``, ``'match'``, ``'postprocess'`` and ``'total'``.
+        """
+        return dict(self._timings)
+
+    def _gray(self, image, name)->numpy.ndarray:
+        if image.ndim == 2:
+            return image
+        code = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(image, code, self._disparity_buffer(name, image.shape[:2], image.dtype))
+
+    def _disparity_buffer(self, name, shape, dtype)->numpy.ndarray:
+        buffer = self._disparity_buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self._disparity_buffers[name] = buffer
+        return buffer
+
+    def _rectified_buffer(self, index, raw)->numpy.ndarray:
+        buffer = self._rectified_pair[index]
+        if buffer is None or buffer.shape != raw.shape or buffer.dtype != raw.dtype:
+            buffer = np.empty(raw.shape, raw.dtype)
+            self._rectified_pair[index] = buffer
+        return buffer
+
     def get_tf_frame(self)->str:
         """ 
         :rtype:                 str      
@@ -840,36 +1947,75 @@ class StereoCameraModel:
         else:
             return (0.0, 0.0, 0.0)
 
-    def get_z(self, disparity)->float:
+    def disparity_to_points(self, disparity, min_depth=None, max_depth=None, compact=False)->numpy.ndarray:
+        """
+        :param disparity:      disparity image of the rectified left camera, in pixels
+        :type disparity:       numpy.ndarray of shape (height, width)
+        :param min_depth:      optional minimum Z; closer points are invalid
+        :type min_depth:       float
+        :param max_depth:      optional maximum Z; farther points are invalid
+        :type max_depth:       float
+        :param compact:        whether to return only the valid points
+        :type compact:         bool
+        :rtype:                numpy.ndarray
+
+        Returns the float32 3D points (x, y, z) for every pixel of the disparity image, using the :math:`Q` matrix.
+        This is the dense version of project_pixel_to_3d().
+
+        Pixels with a non-finite or non-positive disparity, or whose depth is outside [min_depth, max_depth], are invalid.
+        If `compact` is False, a (height, width, 3) array is returned with NaN for invalid pixels,
+        otherwise an (N, 3) array with the valid points only.
+        """
+        disparity = np.asarray(disparity, dtype='float32')
+        height, width = disparity.shape
+        u = np.arange(width, dtype='float32')[np.newaxis, :]
+        v = np.arange(height, dtype='float32')[:, np.newaxis]
+        q = self._q.astype('float32')
+
+        points = np.empty((height, width, 3), dtype='float32')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # [X Y Z W]^T = Q * [u v d 1]^T
+            xyzw = [q[i, 0] * u + q[i, 1] * v + q[i, 2] * disparity + q[i, 3] for i in range(4)]
+            for i in range(3):
+                np.divide(xyzw[i], xyzw[3], out=points[:, :, i])
+        valid = np.isfinite(disparity) & (disparity > 0) & (xyzw[3] != 0)
+
+        z = points[:, :, 2]
+        if min_depth is not None:
+            valid &= z >= min_depth
+        if max_depth is not None:
+            valid &= z <= max_depth
+        if compact:
+            return points[valid]
+        points[~valid] = np.nan
+        return points
+
+    def get_z(self, disparity):
         """
         :param disparity:        disparity, in pixels
-        :type disparity:         float
-        :rtype:                  float
+        :type disparity:         float or numpy.ndarray
+        :rtype:                  float or numpy.ndarray
 
         Returns the depth at which a point is observed with a given disparity.
+        If `disparity` is an array, an array of depths of the same shape is returned.
         This is the inverse of get_disparity().
 
         Note that a disparity of zero implies Z is infinite.
         """
-        if disparity == 0:
-            return float('inf')
-        Tx = -self._right.projection_matrix()[0, 3]
-        return Tx / disparity
+        return _divide_or_inf(self._tx, disparity)
 
-    def get_disparity(self, z)->float:
+    def get_disparity(self, z):
         """
         :param z:          Z (depth), in cartesian space
-        :type z:           float
-        :rtype:            float
+        :type z:           float or numpy.ndarray
+        :rtype:            float or numpy.ndarray
 
         Returns the disparity observed for a point at depth Z.
+        If `z` is an array, an array of disparities of the same shape is returned.
         This is the inverse of get_z().
         """
-        if z == 0:
-            return float('inf')
-        tx = -self._right.projection_matrix()[0, 3]
-        return tx / z
-        
+        return _divide_or_inf(self._tx, z)
+
     def get_left_camera(self)->PinholeCameraModel:
         """ 
         :rtype: PinholeCameraModel
@@ -916,7 +2062,7 @@ class StereoCameraModel:
         return self._q
 
     @deprecated(version="J-turtle", reason="The fromCameraInfo() method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the from_camera_info() method instead.")
-    def fromCameraInfo(self, left_msg, right_msg):
+    def fromCameraInfo(self, left_msg, right_msg)->bool:
         """
         .. warning::
             The fromCameraInfo() method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the from_camera_info() method instead.
@@ -925,11 +2071,13 @@ class StereoCameraModel:
         :type left_msg:  sensor_msgs.msg.CameraInfo
         :param right_msg: right camera parameters
         :type right_msg:  sensor_msgs.msg.CameraInfo
+        :rtype:           bool
 
         Set the camera parameters from the :class:`sensor_msgs.msg.CameraInfo` messages.
+        Returns True if the parameters of either camera changed, False otherwise.
         """
 
-        self.from_camera_info(left_msg,right_msg)
+        return self.from_camera_info(left_msg,right_msg)
 
     @deprecated(version="J-turtle", reason="The getDisparity() method is deprecated as of J-turtle, and will be removed in K-turtle. Please use the get_disparity() method instead.")
     def getDisparity(self, Z)->float:
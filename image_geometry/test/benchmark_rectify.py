@@ -0,0 +1,72 @@
+"""
+Compares the speed and accuracy of PinholeCameraModel.rectify_image for the
+different rectification map types and interpolation methods.
+
+Accuracy is reported as the difference from CV_32FC1 maps with INTER_CUBIC,
+the default settings of rectify_image.
+
+Usage: python3 benchmark_rectify.py [--width W] [--height H] [--iterations N]
+"""
+from __future__ import print_function
+
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+import sensor_msgs.msg
+
+from image_geometry import PinholeCameraModel
+
+MAP_TYPES = [('CV_32FC1', cv2.CV_32FC1), ('CV_32FC2', cv2.CV_32FC2), ('CV_16SC2', cv2.CV_16SC2)]
+INTERPOLATIONS = [('INTER_CUBIC', cv2.INTER_CUBIC), ('INTER_LINEAR', cv2.INTER_LINEAR),
+                  ('INTER_NEAREST', cv2.INTER_NEAREST)]
+
+
+def make_camera_info(width, height):
+    msg = sensor_msgs.msg.CameraInfo()
+    msg.width = width
+    msg.height = height
+    f = 0.7 * width
+    msg.d = [-0.363528858080088, 0.16117037733986861, -8.1109585007538829e-05, -0.00044776712298447841, 0.0]
+    msg.k = [f, 0.0, width / 2.0, 0.0, f, height / 2.0, 0.0, 0.0, 1.0]
+    msg.r = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+    msg.p = [0.7 * f, 0.0, width / 2.0, 0.0, 0.0, 0.7 * f, height / 2.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+    return msg
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    cam = PinholeCameraModel()
+    cam.from_camera_info(make_camera_info(args.width, args.height))
+
+    # A smooth image with some texture, so that interpolation differences are meaningful
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (args.height // 8, args.width // 8, 3), dtype=np.uint8)
+    raw = cv2.resize(noise, (args.width, args.height), interpolation=cv2.INTER_CUBIC)
+
+    reference = np.empty_like(raw)
+    cam.rectify_image(raw, reference, cv2.INTER_CUBIC)
+
+    print('%dx%d, %d iterations' % (args.width, args.height, args.iterations))
+    print('%-10s %-14s %10s %10s %10s %10s' % ('maps', 'interpolation', 'ms/frame', 'maps MB', 'max diff', 'mean diff'))
+    rectified = np.empty_like(raw)
+    for map_name, map_type in MAP_TYPES:
+        cam.set_rectification_map_type(map_type)
+        cam.rectify_image(raw, rectified)
+        map_bytes = sum(m.nbytes for m in (cam._cache.reduced_map1, cam._cache.reduced_map2) if m is not None)
+        for interpolation_name, interpolation in INTERPOLATIONS:
+            seconds = timeit.timeit(lambda: cam.rectify_image(raw, rectified, interpolation), number=args.iterations)
+            diff = np.abs(rectified.astype(np.int16) - reference)
+            print('%-10s %-14s %10.2f %10.1f %10d %10.3f' % (map_name, interpolation_name,
+                                                             1000.0 * seconds / args.iterations,
+                                                             map_bytes / 1e6, diff.max(), diff.mean()))
+
+
+if __name__ == '__main__':
+    main()
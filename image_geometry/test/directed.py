@@ -1,9 +1,15 @@
 from __future__ import print_function
 
+import copy
+import os
+import shutil
+import tempfile
 import unittest
+import cv2
 import sensor_msgs.msg
 
 from image_geometry import PinholeCameraModel, StereoCameraModel
+from image_geometry import RectificationMapCache, get_rectification_map_cache
 import numpy as np
 from numpy.testing import assert_almost_equal
 
@@ -88,6 +94,382 @@ class TestDirected(unittest.TestCase):
             self.cam.get_left_camera().rectifyImage(raw,rectified)
             assert_almost_equal(expected, rectified[56,47])
 
+    def test_rectify_image_cache(self):
+        cam = PinholeCameraModel()
+        cam.from_camera_info(self.lmsg)
+        raw = np.zeros((self.height, self.width), np.uint8)
+        rectified = np.zeros((self.height, self.width), np.uint8)
+        cam.rectify_image(raw, rectified)
+        map1 = cam._cache.reduced_map1
+        self.assertIsNotNone(map1)
+
+        # Unchanged parameters keep the cached maps
+        cam.from_camera_info(self.lmsg)
+        cam.rectify_image(raw, rectified)
+        self.assertIs(map1, cam._cache.reduced_map1)
+
+        # Changed parameters rebuild them
+        self.lmsg.binning_x = 2
+        cam.from_camera_info(self.lmsg)
+        self.assertTrue(cam._cache.reduced_maps_dirty)
+        cam.rectify_image(raw[:, :320], rectified[:, :320].copy())
+        self.assertIsNot(map1, cam._cache.reduced_map1)
+
+    def test_shared_map_cache(self):
+        raw = np.zeros((self.height, self.width), np.uint8)
+        rectified = np.zeros((self.height, self.width), np.uint8)
+
+        # Sharing is disabled by default
+        cache = get_rectification_map_cache()
+        self.assertEqual(0, cache.max_bytes())
+        cams = [PinholeCameraModel(), PinholeCameraModel()]
+        for cam in cams:
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, rectified)
+        self.assertIsNot(cams[0]._cache.full_map1, cams[1]._cache.full_map1)
+        self.assertEqual(0, len(cache))
+
+        cache.set_max_bytes(64 * 1024 * 1024)
+        self.addCleanup(cache.clear)
+        self.addCleanup(cache.set_max_bytes, 0)
+        cams = [PinholeCameraModel(), PinholeCameraModel()]
+        for cam in cams:
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, rectified)
+            cam.unrectify_image(rectified, raw)
+
+        # Identical calibrations share one set of read-only maps
+        self.assertIs(cams[0]._cache.full_map1, cams[1]._cache.full_map1)
+        self.assertIs(cams[0]._cache.unrectify_full_map1, cams[1]._cache.unrectify_full_map1)
+        self.assertFalse(cams[0]._cache.full_map1.flags.writeable)
+
+        # Any change to the calibration, ROI or map type gives different maps
+        self.lmsg.roi.x_offset = 100
+        self.lmsg.roi.width = 320
+        self.lmsg.roi.height = 240
+        cams[1].from_camera_info(self.lmsg)
+        cams[1].rectify_image(raw[:240, :320], rectified[:240, :320].copy())
+        self.assertIs(cams[0]._cache.full_map1, cams[1]._cache.full_map1)
+        self.assertIsNot(cams[0]._cache.reduced_map1, cams[1]._cache.reduced_map1)
+        cams[0].set_rectification_map_type(cv2.CV_16SC2)
+        cams[0].rectify_image(raw, rectified)
+        self.assertIsNot(cams[0]._cache.full_map1, cams[1]._cache.full_map1)
+
+        self.assertIsInstance(get_rectification_map_cache(), RectificationMapCache)
+
+    def test_map_cache_eviction(self):
+        maps = [(np.zeros(100, np.float32), np.zeros(100, np.float32)) for i in range(3)]
+        cache = RectificationMapCache(max_bytes=2000)
+        for i, m in enumerate(maps):
+            self.assertIs(m, cache.put(i, m))
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1600, cache.nbytes())
+        self.assertIsNone(cache.get(0))
+
+        # Lookups refresh an entry, so the least recently used one is evicted
+        self.assertIs(maps[1], cache.get(1))
+        cache.put(0, maps[0])
+        self.assertIsNone(cache.get(2))
+        self.assertIs(maps[1], cache.get(1))
+
+        # Existing entries win over new maps with the same key
+        self.assertIs(maps[1], cache.put(1, maps[2]))
+
+        cache.set_max_bytes(800)
+        self.assertEqual(1, len(cache))
+        cache.clear()
+        self.assertEqual(0, cache.nbytes())
+
+        # Maps larger than the budget are returned uncached and writeable
+        big = (np.zeros(1000, np.float32), None)
+        self.assertIs(big, cache.put(3, big))
+        self.assertIsNone(cache.get(3))
+        self.assertTrue(big[0].flags.writeable)
+        self.assertRaises(ValueError, cache.set_max_bytes, -1)
+
+    def test_map_cache_directory(self):
+        directory = tempfile.mkdtemp()
+        cache = get_rectification_map_cache()
+        try:
+            cache.clear()
+            cache.set_directory(directory)
+            raw = np.random.randint(0, 256, (self.height, self.width), np.uint8)
+            expected = np.zeros_like(raw)
+            cam = PinholeCameraModel()
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, expected)
+            self.assertEqual(2, len([f for f in os.listdir(directory) if f.endswith('.npy')]))
+
+            # A new process would load the maps from disk instead of building them
+            cache.clear()
+            rectified = np.zeros_like(raw)
+            cam = PinholeCameraModel()
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, rectified)
+            self.assertIsInstance(cam._cache.full_map1, np.memmap)
+            self.assertFalse(cam._cache.full_map1.flags.writeable)
+            self.assertTrue(np.array_equal(expected, rectified))
+
+            # Each map type has its own files
+            cam.set_rectification_map_type(cv2.CV_16SC2)
+            cam.rectify_image(raw, rectified)
+            self.assertEqual(4, len([f for f in os.listdir(directory) if f.endswith('.npy')]))
+
+            # Unreadable files are rebuilt and replaced
+            cache.clear()
+            for f in os.listdir(directory):
+                with open(os.path.join(directory, f), 'wb') as fp:
+                    fp.write(b'garbage')
+            cam = PinholeCameraModel()
+            cam.from_camera_info(self.lmsg)
+            with self.assertWarns(RuntimeWarning):
+                cam.rectify_image(raw, rectified)
+            self.assertTrue(np.array_equal(expected, rectified))
+            cache.clear()
+            cam = PinholeCameraModel()
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, rectified)
+            self.assertIsInstance(cam._cache.full_map1, np.memmap)
+
+            # Only the full-resolution rectification maps are saved, not the ROI or unrectification maps
+            for f in os.listdir(directory):
+                os.remove(os.path.join(directory, f))
+            cache.clear()
+            cam = PinholeCameraModel()
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw, rectified)
+            cam.unrectify_image(rectified, raw)
+            self.lmsg.roi.x_offset = 100
+            self.lmsg.roi.width = 320
+            self.lmsg.roi.height = 240
+            cam.from_camera_info(self.lmsg)
+            cam.rectify_image(raw[:240, :320], rectified[:240, :320].copy())
+            self.assertEqual(2, len([f for f in os.listdir(directory) if f.endswith('.npy')]))
+
+            # CV_32FC1 and CV_16SC2 maps without a map2 file are rebuilt, while CV_32FC2 maps have none
+            for f in os.listdir(directory):
+                if f.endswith('_map2.npy'):
+                    os.remove(os.path.join(directory, f))
+            for map_type in (cv2.CV_32FC1, cv2.CV_16SC2, cv2.CV_32FC2):
+                cache.clear()
+                cam = PinholeCameraModel()
+                cam.set_rectification_map_type(map_type)
+                cam.from_camera_info(self.lmsg)
+                cam.rectify_image(raw[:240, :320], rectified[:240, :320].copy())
+                self.assertNotIsInstance(cam._cache.full_map1, np.memmap)
+                cache.clear()
+                cam = PinholeCameraModel()
+                cam.set_rectification_map_type(map_type)
+                cam.from_camera_info(self.lmsg)
+                cam.rectify_image(raw[:240, :320], rectified[:240, :320].copy())
+                self.assertIsInstance(cam._cache.full_map1, np.memmap)
+        finally:
+            cache.set_directory(None)
+            cache.clear()
+            shutil.rmtree(directory)
+
+    def test_copy(self):
+        cam = PinholeCameraModel()
+        self.assertFalse(hasattr(cam, '__dict__'))
+        cam.from_camera_info(self.lmsg)
+        raw = np.zeros((self.height, self.width), np.uint8)
+        rectified = np.zeros_like(raw)
+        cam.rectify_image(raw, rectified)
+
+        # The matrices are writable views into one parameter block, which snapshots copy
+        k = cam.intrinsic_matrix()
+        self.assertTrue(k.flags.writeable)
+        self.assertIs(cam._params, k.base)
+        snapshot = cam.copy()
+        self.assertIsNot(cam._params, snapshot._params)
+        assert_almost_equal(cam._params, snapshot._params)
+        self.assertIs(cam._cache.reduced_map1, snapshot._cache.reduced_map1)
+        self.assertIsNot(cam._cache, snapshot._cache)
+        self.assertIsNot(cam._raw_roi, snapshot._raw_roi)
+        self.assertIsNot(cam._params, copy.copy(cam)._params)
+
+        # Modifying the matrices of a copy in place leaves the original unchanged
+        other = cam.copy()
+        other.intrinsic_matrix()[0, 0] += 1.0
+        other._raw_roi.x_offset = 10
+        assert_almost_equal(k, snapshot.intrinsic_matrix())
+        self.assertEqual(0, cam._raw_roi.x_offset)
+
+        # Changing the model replaces the parameter block, and leaves the snapshot unchanged
+        self.lmsg.roi.x_offset = 100
+        self.lmsg.roi.width = 320
+        self.lmsg.roi.height = 240
+        cam.from_camera_info(self.lmsg)
+        self.assertIsNot(cam._params, snapshot._params)
+        assert_almost_equal(k, snapshot.intrinsic_matrix())
+        assert_almost_equal(k[0, 2] - 100, cam.intrinsic_matrix()[0, 2])
+        self.assertIs(cam.full_intrinsic_matrix().base, cam._params)
+        assert_almost_equal(snapshot.full_intrinsic_matrix(), cam.full_intrinsic_matrix())
+        self.assertEqual((self.width, self.height), snapshot.reduced_resolution())
+        self.assertEqual((320, 240), cam.reduced_resolution())
+        snapshot.rectify_image(raw, rectified)
+
+    def test_rectify_image_map_type(self):
+        cam = self.cam.get_left_camera()
+        raw = (np.add.outer(np.arange(self.height), np.arange(self.width)) // 5).astype(np.uint8)
+        expected = np.zeros_like(raw)
+        rectified = np.zeros_like(raw)
+        cam.rectify_image(raw, expected, cv2.INTER_LINEAR)
+        self.assertEqual(cv2.CV_32FC1, cam.rectification_map_type())
+
+        cam.set_rectification_map_type(cv2.CV_16SC2)
+        self.assertTrue(cam._cache.reduced_maps_dirty)
+        cam.rectify_image(raw, rectified, cv2.INTER_LINEAR)
+        self.assertEqual(np.int16, cam._cache.reduced_map1.dtype)
+        self.assertLessEqual(np.abs(expected.astype(int) - rectified).max(), 1)
+
+        cam.rectify_image(raw, rectified, cv2.INTER_NEAREST)
+        self.assertRaises(ValueError, lambda: cam.set_rectification_map_type(cv2.CV_8UC1))
+
+    def test_rectify_image_roi(self):
+        cam = self.cam.get_left_camera()
+        raw = (np.add.outer(np.arange(self.height), np.arange(self.width)) // 5).astype(np.uint8)
+        raw = np.dstack((raw, raw // 2, raw // 3))
+        expected = np.zeros_like(raw)
+        for map_type in (cv2.CV_32FC1, cv2.CV_32FC2, cv2.CV_16SC2):
+            cam.set_rectification_map_type(map_type)
+            cam.rectify_image(raw, expected, cv2.INTER_LINEAR)
+            patch = cam.rectify_image_roi(raw, (100, 50, 64, 32), interpolation=cv2.INTER_LINEAR)
+            np.testing.assert_array_equal(expected[50:82, 100:164], patch)
+
+        out = np.zeros((32, 64, 3), np.uint8)
+        patch = cam.rectify_image_roi(raw, (0, 448, 64, 32), out)
+        self.assertIs(out, patch)
+        cam.rectify_image(raw, expected)
+        np.testing.assert_array_equal(expected[448:480, 0:64], out)
+
+        self.assertRaises(ValueError, lambda: cam.rectify_image_roi(raw, (600, 0, 64, 32)))
+        self.assertRaises(ValueError, lambda: cam.rectify_image_roi(raw, (0, 0, 64, 32), np.zeros((32, 64), np.uint8)))
+
+    def test_rectify_image_reduced(self):
+        raw = (np.add.outer(np.arange(self.height), np.arange(self.width)) // 5).astype(np.uint8)
+        roi = (slice(100, 340), slice(200, 520))
+        full_cam = PinholeCameraModel()
+        full_cam.from_camera_info(self.lmsg)
+        self.lmsg.roi.x_offset = 200
+        self.lmsg.roi.y_offset = 100
+        self.lmsg.roi.width = 320
+        self.lmsg.roi.height = 240
+        roi_cam = PinholeCameraModel()
+        roi_cam.from_camera_info(self.lmsg)
+        self.assertTupleEqual((320, 240), roi_cam.reduced_resolution())
+
+        for map_type in (cv2.CV_32FC1, cv2.CV_32FC2, cv2.CV_16SC2):
+            full_cam.set_rectification_map_type(map_type)
+            roi_cam.set_rectification_map_type(map_type)
+            expected = np.zeros_like(raw)
+            full_cam.rectify_image(raw, expected, cv2.INTER_NEAREST)
+            rectified = np.zeros((240, 320), np.uint8)
+            roi_cam.rectify_image(raw[roi], rectified, cv2.INTER_NEAREST)
+            # The rectified ROI matches the full rectified image where its source pixels are inside the ROI
+            np.testing.assert_array_equal(expected[roi][60:180, 80:240], rectified[60:180, 80:240])
+
+            unrectified = np.zeros((240, 320), np.uint8)
+            roi_cam.unrectify_image(rectified, unrectified, cv2.INTER_NEAREST)
+            self.assertLessEqual(np.abs(raw[roi][60:180, 80:240].astype(int) - unrectified[60:180, 80:240]).max(), 1)
+
+        # A change of ROI only crops the cached full maps again
+        full_map1 = roi_cam._cache.full_map1
+        self.lmsg.roi.x_offset = 0
+        roi_cam.from_camera_info(self.lmsg)
+        roi_cam.rectify_image(raw[100:340, 0:320], rectified)
+        self.assertIs(full_map1, roi_cam._cache.full_map1)
+
+        self.lmsg.binning_x = 2
+        self.lmsg.binning_y = 2
+        roi_cam.from_camera_info(self.lmsg)
+        self.assertTupleEqual((160, 120), roi_cam.reduced_resolution())
+        rectified = np.zeros((120, 160), np.uint8)
+        roi_cam.rectify_image(cv2.resize(raw, (320, 240))[50:170, 0:160], rectified)
+        self.assertEqual((240, 320, 2), roi_cam._cache.full_map1.shape)
+        self.assertEqual((120, 160, 2), roi_cam._cache.reduced_map1.shape)
+
+    def equidistant_msg(self):
+        # These parameters taken from a real fisheye camera calibration
+        msg = sensor_msgs.msg.CameraInfo()
+        msg.width = 640
+        msg.height = 512
+        msg.distortion_model = "equidistant"
+        msg.d = [-0.08857683871674071, 0.0708113094372378, -0.09127623055964429, 0.04006922269778478]
+        msg.k = [403.603063319358, 0.0, 306.15842863283063, 0.0, 403.7028851121003, 261.09715697592696, 0.0, 0.0, 1.0]
+        msg.r = [0.999963944103842, -0.008484152966323483, 0.00036005656766869323, 0.008484153516269438, 0.9999640089218772, 0.0, -0.0003600436088446379, 3.0547751946422504e-06, 0.999999935179632]
+        msg.p = [347.2569964503485, 0.0, 350.5, 0.0, 0.0, 347.2569964503485, 256.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+        return msg
+
+    def test_equidistant(self):
+        msg = self.equidistant_msg()
+        cam = PinholeCameraModel()
+        cam.from_camera_info(msg)
+
+        uv_raw = np.array([[100.0, 100.0], [306.0, 261.0], [600.0, 500.0]])
+        expected = cv2.fisheye.undistortPoints(uv_raw.reshape(-1, 1, 2), cam.intrinsic_matrix(), cam.distortion_coeffs(),
+                                               R=cam.rotation_matrix(), P=cam.projection_matrix()).reshape(-1, 2)
+        assert_almost_equal(expected, cam.rectify_points(uv_raw), 6)
+        assert_almost_equal(expected[0], cam.rectify_point(uv_raw[0]), 6)
+        assert_almost_equal(uv_raw, cam.unrectify_points(expected), 3)
+
+        # The rectification maps point back to the raw pixels that rectify to each pixel
+        raw = np.zeros((msg.height, msg.width), np.uint8)
+        rectified = np.zeros_like(raw)
+        cam.rectify_image(raw, rectified)
+        for u, v in ((100, 100), (350, 256), (500, 400)):
+            uv = (cam._cache.reduced_map1[v, u], cam._cache.reduced_map2[v, u])
+            assert_almost_equal((u, v), cam.rectify_point(uv), 2)
+
+        # Switching the distortion model rebuilds the maps
+        msg.distortion_model = "plumb_bob"
+        self.assertTrue(cam.from_camera_info(msg))
+        self.assertTrue(cam._cache.reduced_maps_dirty)
+        self.assertGreater(np.abs(expected[0] - cam.rectify_point(uv_raw[0])).max(), 1.0)
+
+    def test_map_types_distortion_models(self):
+        for msg in (self.lmsg, self.equidistant_msg()):
+            cam = PinholeCameraModel()
+            cam.from_camera_info(msg)
+            raw = (np.add.outer(np.arange(msg.height), np.arange(msg.width)) // 5).astype(np.uint8)
+            expected_rectified = np.zeros_like(raw)
+            expected_raw = np.zeros_like(raw)
+            cam.rectify_image(raw, expected_rectified, cv2.INTER_LINEAR)
+            cam.unrectify_image(expected_rectified, expected_raw, cv2.INTER_LINEAR)
+            for map_type in (cv2.CV_32FC1, cv2.CV_32FC2, cv2.CV_16SC2):
+                cam.set_rectification_map_type(map_type)
+                rectified = np.zeros_like(raw)
+                unrectified = np.zeros_like(raw)
+                cam.rectify_image(raw, rectified, cv2.INTER_LINEAR)
+                cam.unrectify_image(rectified, unrectified, cv2.INTER_LINEAR)
+                self.assertLessEqual(np.abs(rectified.astype(int) - expected_rectified).max(), 1)
+                self.assertLessEqual(np.abs(unrectified.astype(int) - expected_raw).max(), 1)
+
+    def test_from_camera_info_changed(self):
+        self.assertFalse(self.cam.from_camera_info(self.lmsg, self.rmsg))
+
+        cam = PinholeCameraModel()
+        self.assertTrue(cam.from_camera_info(self.lmsg))
+        k = cam.intrinsic_matrix()
+        self.assertFalse(cam.from_camera_info(self.lmsg))
+        self.assertIs(k, cam.intrinsic_matrix())
+
+        # Header changes are picked up without touching the calibration
+        self.lmsg.header.frame_id = "other_camera"
+        self.assertFalse(cam.from_camera_info(self.lmsg))
+        self.assertEqual("other_camera", cam.get_tf_frame())
+
+        self.lmsg.roi.x_offset = 10
+        self.lmsg.roi.width = 320
+        self.lmsg.roi.height = 240
+        self.assertTrue(cam.from_camera_info(self.lmsg))
+        assert_almost_equal(311.713398 - 10, cam.intrinsic_matrix()[0, 2], 6)
+        self.assertTrue(self.cam.from_camera_info(self.lmsg, self.rmsg))
+
+        self.lmsg.d = []
+        self.assertTrue(cam.from_camera_info(self.lmsg))
+        self.assertIsNone(cam.distortion_coeffs())
+        self.assertFalse(cam.from_camera_info(self.lmsg))
 
     def test_rectify_point(self):
         uv_raw = (1.0, 2.0)
@@ -98,6 +480,47 @@ class TestDirected(unittest.TestCase):
             deprecated = self.cam.get_left_camera().rectifyPoint(uv_raw)
             assert_almost_equal(expected, deprecated, 3)
 
+    def test_rectify_points(self):
+        cam = self.cam.get_left_camera()
+        uv_raw = np.array([[1.0, 2.0], [320.0, 240.0], [600.0, 17.0]])
+        expected = [cam.rectify_point(uv) for uv in uv_raw]
+        actual = cam.rectify_points(uv_raw)
+        self.assertEqual((3, 2), actual.shape)
+        assert_almost_equal(expected, actual, 3)
+
+        out = np.empty((3, 2))
+        self.assertIs(out, cam.rectify_points(uv_raw, out))
+        assert_almost_equal(expected, out, 3)
+        self.assertRaises(ValueError, lambda: cam.rectify_points(uv_raw, np.empty((3, 2), np.float32)))
+        self.assertEqual((0, 2), cam.rectify_points(np.empty((0, 2))).shape)
+
+    def test_unrectify_points(self):
+        cam = self.cam.get_left_camera()
+        uv_raw = np.array([[1.0, 2.0], [320.0, 240.0], [600.0, 17.0]])
+        uv_rect = cam.rectify_points(uv_raw)
+        assert_almost_equal(uv_raw, cam.unrectify_points(uv_rect), 3)
+        assert_almost_equal(uv_raw[0], cam.unrectify_point(uv_rect[0]), 3)
+        self.assertEqual((0, 2), cam.unrectify_points(np.empty((0, 2))).shape)
+
+    def test_unrectify_image(self):
+        cam = self.cam.get_left_camera()
+        raw = (np.add.outer(np.arange(self.height), np.arange(self.width)) // 5).astype(np.uint8)
+        rectified = np.zeros_like(raw)
+        unrectified = np.zeros_like(raw)
+        cam.rectify_image(raw, rectified, cv2.INTER_LINEAR)
+        cam.unrectify_image(rectified, unrectified, cv2.INTER_LINEAR)
+        # Compare the center of the image, where no pixels are lost to the rectification
+        center = (slice(160, 320), slice(200, 440))
+        self.assertLessEqual(np.abs(raw[center].astype(int) - unrectified[center]).max(), 1)
+
+        map1 = cam._cache.unrectify_reduced_map1
+        cam.unrectify_image(rectified, unrectified)
+        self.assertIs(map1, cam._cache.unrectify_reduced_map1)
+        cam.set_rectification_map_type(cv2.CV_16SC2)
+        cam.unrectify_image(rectified, unrectified, cv2.INTER_LINEAR)
+        self.assertEqual(np.int16, cam._cache.unrectify_reduced_map1.dtype)
+        self.assertLessEqual(np.abs(raw[center].astype(int) - unrectified[center]).max(), 2)
+
     def test_project_3d_to_pixel(self):
         point = (1.0, 2.0, 3.0)
         expected = [384.069,420.319]
@@ -107,6 +530,19 @@ class TestDirected(unittest.TestCase):
             actual = self.cam.get_left_camera().project3dToPixel(point)
             assert_almost_equal(expected,actual,3)
 
+    def test_project_3d_to_pixels(self):
+        cam = self.cam.get_left_camera()
+        points = np.array([[1.0, 2.0, 3.0], [0.1, -0.2, 1.0], [-5.0, 0.0, 1.0], [0.0, 0.0, -1.0], [1.0, 1.0, 0.0]])
+        expected = [cam.project_3d_to_pixel(point) for point in points]
+        actual = cam.project_3d_to_pixels(points)
+        self.assertEqual((5, 2), actual.shape)
+        assert_almost_equal(expected, actual, 6)
+        self.assertTrue(np.isnan(actual[4]).all())
+
+        actual, mask = cam.project_3d_to_pixels(points, return_mask=True)
+        assert_almost_equal(expected, actual, 6)
+        self.assertListEqual([True, True, False, False, False], mask.tolist())
+
     def test_project_pixel_to_3d_ray(self):
         uv = (1.0, 2.0)
         expected = [-0.61,-0.475,0.634]
@@ -116,6 +552,85 @@ class TestDirected(unittest.TestCase):
             actual = self.cam.get_left_camera().projectPixelTo3dRay(uv)
             assert_almost_equal(expected,actual,3)
 
+    def test_in_frustum(self):
+        cam = self.cam.get_left_camera()
+        rng = np.random.default_rng(0)
+        points = rng.uniform((-10, -10, -2), (10, 10, 20), (1000, 3))
+        points[0] = (0, 0, 0)
+
+        uv, expected = cam.project_3d_to_pixels(points, return_mask=True)
+        mask, pixels = cam.in_frustum(points, return_pixels=True)
+        self.assertEqual(np.bool_, mask.dtype)
+        self.assertTrue(np.array_equal(expected, mask))
+        self.assertTrue(0 < mask.sum() < len(points))
+        assert_almost_equal(uv[mask], pixels)
+
+        mask = cam.in_frustum(points, 5.0, 10.0)
+        self.assertTrue(np.array_equal(expected & (points[:, 2] >= 5) & (points[:, 2] <= 10), mask))
+        self.assertEqual((0,), cam.in_frustum(np.zeros((0, 3))).shape)
+
+        # The ROI and binning shrink the frustum
+        self.lmsg.roi.x_offset = 320
+        self.lmsg.roi.width = 320
+        self.lmsg.roi.height = 240
+        self.lmsg.binning_x = 2
+        cam.from_camera_info(self.lmsg)
+        _, expected = cam.project_3d_to_pixels(points, return_mask=True)
+        mask, pixels = cam.in_frustum(points, return_pixels=True)
+        self.assertTrue(np.array_equal(expected, mask))
+        self.assertTrue(np.all(pixels < (160, 240)))
+
+    def test_project_pixels_to_3d_rays(self):
+        cam = self.cam.get_left_camera()
+        uv = np.array([[1.0, 2.0], [320.0, 240.0], [639.0, 479.0]])
+        expected = [cam.project_pixel_to_3d_ray(p) for p in uv]
+        actual = cam.project_pixels_to_3d_rays(uv)
+        self.assertEqual((3, 3), actual.shape)
+        assert_almost_equal(expected, actual, 6)
+
+    def test_ray_grid(self):
+        cam = self.cam.get_left_camera()
+        grid = cam.ray_grid()
+        self.assertEqual((self.height, self.width, 3), grid.shape)
+        self.assertFalse(grid.flags.writeable)
+        assert_almost_equal(cam.project_pixel_to_3d_ray((1, 2)), grid[2, 1], 6)
+        assert_almost_equal(cam.project_pixel_to_3d_ray((639, 479)), grid[479, 639], 6)
+        self.assertIs(grid, cam.ray_grid())
+
+        self.lmsg.binning_x = 2
+        self.lmsg.binning_y = 2
+        cam.from_camera_info(self.lmsg)
+        grid = cam.ray_grid()
+        self.assertEqual((self.height // 2, self.width // 2, 3), grid.shape)
+        assert_almost_equal(cam.project_pixel_to_3d_ray((100, 50)), grid[50, 100], 6)
+
+    def test_depth_to_points(self):
+        cam = self.cam.get_left_camera()
+        depth = np.full((self.height, self.width), 2000, np.uint16)
+        depth[0, 0] = 0
+        points = cam.depth_to_points(depth)
+        self.assertEqual((self.height * self.width - 1, 3), points.shape)
+        self.assertEqual(np.float32, points.dtype)
+        ray = cam.project_pixel_to_3d_ray((1, 0))
+        assert_almost_equal(np.array(ray) * (2.0 / ray[2]), points[0], 4)
+
+        depth = np.full((self.height, self.width), 1.5, np.float32)
+        depth[2, 4] = np.nan
+        colors = np.zeros((self.height, self.width, 3), np.uint8)
+        colors[2, 6] = (1, 2, 3)
+        points, point_colors = cam.depth_to_points(depth, stride=2, colors=colors, remove_invalid=False)
+        self.assertEqual((self.height // 2, self.width // 2, 3), points.shape)
+        self.assertTrue(np.isnan(points[1, 2]).all())
+        ray = cam.project_pixel_to_3d_ray((6, 2))
+        assert_almost_equal(np.array(ray) * (1.5 / ray[2]), points[1, 3], 4)
+        assert_almost_equal((1, 2, 3), point_colors[1, 3])
+
+        points, point_colors = cam.depth_to_points(depth, stride=2, colors=colors)
+        self.assertEqual((self.height * self.width // 4 - 1, 3), points.shape)
+        self.assertEqual((points.shape[0], 3), point_colors.shape)
+        self.assertRaises(ValueError, lambda: cam.depth_to_points(depth[1:]))
+        self.assertRaises(ValueError, lambda: cam.depth_to_points(np.zeros((self.height, self.width), np.int32)))
+
     def test_get_delta_u(self):
         delta_x = 1.0
         z = 2.0
@@ -164,6 +679,57 @@ class TestDirected(unittest.TestCase):
             actual = self.cam.get_left_camera().fullResolution()
             self.assertTupleEqual(expected,actual)
 
+    def test_reduced_resolution(self):
+        self.assertTupleEqual((640, 480), self.cam.get_left_camera().reduced_resolution())
+        cam = PinholeCameraModel()
+        self.lmsg.binning_x = 2
+        self.lmsg.binning_y = 2
+        cam.from_camera_info(self.lmsg)
+        self.assertTupleEqual((320, 240), cam.reduced_resolution())
+
+    def test_rectified_roi(self):
+        self.assertTupleEqual((0, 0, 640, 480), self.cam.get_left_camera().rectified_roi())
+        cam = PinholeCameraModel()
+
+        self.lmsg.roi.x_offset = 100
+        self.lmsg.roi.y_offset = 50
+        self.lmsg.roi.width = 400
+        self.lmsg.roi.height = 300
+        cam.from_camera_info(self.lmsg)
+        self.assertTupleEqual((100, 50, 400, 300), cam.rectified_roi())
+
+        # The bounding box of the rectified corners of the raw ROI
+        tl, tr, br, bl = self.cam.get_left_camera().rectify_points([[100, 50], [500, 50], [500, 350], [100, 350]])
+        x = int(np.ceil(min(tl[0], bl[0])))
+        y = int(np.ceil(min(tl[1], tr[1])))
+        expected = (x, y, int(np.floor(max(tr[0], br[0]))) - x, int(np.floor(max(bl[1], br[1]))) - y)
+        self.lmsg.roi.do_rectify = True
+        cam.from_camera_info(self.lmsg)
+        self.assertTupleEqual(expected, cam.rectified_roi())
+        self.assertIs(cam.rectified_roi(), cam.rectified_roi())
+
+    def test_to_full_resolution(self):
+        cam = PinholeCameraModel()
+        self.lmsg.binning_x = 2
+        self.lmsg.binning_y = 4
+        self.lmsg.roi.x_offset = 100
+        self.lmsg.roi.y_offset = 40
+        self.lmsg.roi.width = 400
+        self.lmsg.roi.height = 400
+        cam.from_camera_info(self.lmsg)
+
+        assert_almost_equal((110.0, 52.0), cam.to_full_resolution((5.0, 3.0)))
+        uv_reduced = np.array([[5.0, 3.0], [0.5, 0.25]])
+        uv_full = cam.to_full_resolution(uv_reduced)
+        assert_almost_equal([[110.0, 52.0], [101.0, 41.0]], uv_full)
+        assert_almost_equal(uv_reduced, cam.to_reduced_resolution(uv_full))
+
+        self.assertListEqual([110, 52, 20, 40], cam.to_full_resolution_rect((5, 3, 10, 10)).tolist())
+        rects = np.array([[5, 3, 10, 10], [0, 0, 200, 100]])
+        full_rects = cam.to_full_resolution_rect(rects)
+        self.assertListEqual([[110, 52, 20, 40], [100, 40, 400, 400]], full_rects.tolist())
+        self.assertListEqual(rects.tolist(), cam.to_reduced_resolution_rect(full_rects).tolist())
+
     def test_intrinsic_matrix(self):
         expected = [[430.15433 ,   0.      , 311.713398],
                     [  0.      , 430.609204, 221.068249],
@@ -311,6 +877,113 @@ class TestDirected(unittest.TestCase):
             actual = self.cam.projectPixelTo3d(left_uv, disparity)
             assert_almost_equal(expected, actual, 6)
 
+    def test_stereo_rectify_pair(self):
+        left_raw = np.random.randint(0, 256, (self.height, self.width, 3), np.uint8)
+        right_raw = np.random.randint(0, 256, (self.height, self.width, 3), np.uint8)
+        left_expected = np.zeros_like(left_raw)
+        right_expected = np.zeros_like(right_raw)
+        self.cam.get_left_camera().rectify_image(left_raw, left_expected)
+        self.cam.get_right_camera().rectify_image(right_raw, right_expected)
+
+        left, right = self.cam.rectify_pair(left_raw, right_raw)
+        self.assertTrue(np.array_equal(left_expected, left))
+        self.assertTrue(np.array_equal(right_expected, right))
+
+        # The output buffers are reused for images of the same size and type
+        left2, right2 = self.cam.rectify_pair(left_raw, right_raw, parallel=True)
+        self.assertIs(left, left2)
+        self.assertIs(right, right2)
+        self.assertTrue(np.array_equal(left_expected, left2))
+        self.assertTrue(np.array_equal(right_expected, right2))
+        left3, _ = self.cam.rectify_pair(left_raw[:, :, 0], right_raw[:, :, 0])
+        self.assertIsNot(left, left3)
+        self.assertEqual((self.height, self.width), left3.shape)
+
+        # close() stops the worker thread, which is restarted when needed
+        executor = self.cam._executor
+        self.cam.close()
+        self.assertIsNone(self.cam._executor)
+        self.assertRaises(RuntimeError, executor.submit, int)
+        with StereoCameraModel() as cam:
+            cam.from_camera_info(self.lmsg, self.rmsg)
+            left, right = cam.rectify_pair(left_raw, right_raw, parallel=True)
+            self.assertTrue(np.array_equal(left_expected, left))
+            executor = cam._executor
+        self.assertIsNone(cam._executor)
+        self.assertRaises(RuntimeError, executor.submit, int)
+
+    def test_stereo_compute_disparity(self):
+        # A textured scene at a constant disparity of 8 pixels, mapped back to the raw images
+        rng = np.random.default_rng(0)
+        texture = rng.integers(0, 256, (self.height // 4, self.width // 4), dtype=np.uint8)
+        left_rect = cv2.resize(texture, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        right_rect = np.roll(left_rect, -8, axis=1)
+        left_raw = np.zeros_like(left_rect)
+        right_raw = np.zeros_like(right_rect)
+        self.cam.get_left_camera().unrectify_image(left_rect, left_raw)
+        self.cam.get_right_camera().unrectify_image(right_rect, right_raw)
+
+        for scale in (1.0, 0.5):
+            disparity = self.cam.compute_disparity(left_raw, right_raw, scale)
+            self.assertEqual((self.height, self.width), disparity.shape)
+            self.assertEqual(np.float32, disparity.dtype)
+            center = disparity[150:330, 200:440]
+            self.assertTrue(np.all(np.abs(center - 8) < 1))
+            # Pixels near the left border have no match
+            self.assertTrue(np.isnan(disparity[240, 0]))
+            timings = self.cam.last_timings()
+            self.assertEqual({'rectify', 'convert', 'resize', 'match', 'postprocess', 'total'}, set(timings))
+            self.assertTrue(timings['total'] >= timings['match'] > 0)
+
+        # The disparity is aligned with Q
+        points = self.cam.disparity_to_points(disparity)
+        assert_almost_equal(self.cam.get_z(8.0), np.nanmedian(points[150:330, 200:440, 2]), 4)
+
+        # The matcher and buffers are reused, and the matcher can be replaced
+        matcher = self.cam.stereo_matcher()
+        self.assertIs(disparity, self.cam.compute_disparity(left_raw, right_raw, 0.5))
+        self.assertIs(matcher, self.cam.stereo_matcher())
+        self.cam.set_stereo_matcher(cv2.StereoBM_create(numDisparities=32, blockSize=15))
+        disparity = self.cam.compute_disparity(cv2.cvtColor(left_raw, cv2.COLOR_GRAY2BGR),
+                                               cv2.cvtColor(right_raw, cv2.COLOR_GRAY2BGR))
+        self.assertTrue(np.nanmedian(np.abs(disparity[150:330, 200:440] - 8)) < 1)
+        self.assertRaises(ValueError, self.cam.compute_disparity, left_raw, right_raw, 0)
+
+        # Disparities are rescaled by the actual ratio of the widths, which differs from 1 / scale after rounding
+        class ConstantMatcher:
+            def getMinDisparity(self):
+                return 0
+
+            def compute(self, left, right, disparity):
+                disparity[:] = 16 * 10
+                return disparity
+
+        self.cam.set_stereo_matcher(ConstantMatcher())
+        disparity = self.cam.compute_disparity(left_raw, right_raw, 0.33)
+        assert_almost_equal(10.0 * self.width / round(self.width * 0.33), disparity[240, 320], 5)
+
+    def test_stereo_disparity_to_points(self):
+        disparity = np.full((self.height, self.width), 2.5, np.float32)
+        disparity[0, :4] = (0.0, -1.0, np.nan, np.inf)
+        disparity[1, 0] = 25.0
+        points = self.cam.disparity_to_points(disparity)
+        self.assertEqual((self.height, self.width, 3), points.shape)
+        self.assertEqual(np.float32, points.dtype)
+        self.assertTrue(np.isnan(points[0, :4]).all())
+        for u, v in ((4, 0), (320, 240), (639, 479), (0, 1)):
+            expected = self.cam.project_pixel_to_3d((u, v), disparity[v, u])
+            assert_almost_equal(expected, points[v, u], 3)
+
+        compact = self.cam.disparity_to_points(disparity, compact=True)
+        self.assertEqual((self.height * self.width - 4, 3), compact.shape)
+
+        z_near = self.cam.get_z(25.0)
+        z_far = self.cam.get_z(2.5)
+        compact = self.cam.disparity_to_points(disparity, min_depth=z_near + 1, compact=True)
+        self.assertEqual((self.height * self.width - 5, 3), compact.shape)
+        compact = self.cam.disparity_to_points(disparity, max_depth=z_far - 1, compact=True)
+        self.assertEqual((1, 3), compact.shape)
+
     def test_stereo_get_z(self):
         disparity = 1.1234
         expected = 23.59613246
@@ -320,6 +993,18 @@ class TestDirected(unittest.TestCase):
             actual = self.cam.getZ(disparity)
             assert_almost_equal(expected, actual, 6)
 
+    def test_stereo_get_z_array(self):
+        disparity = np.array([[1.1234, 0.0], [2.0, 4.0]], np.float32)
+        actual = self.cam.get_z(disparity)
+        self.assertEqual(disparity.shape, actual.shape)
+        self.assertEqual(np.float32, actual.dtype)
+        assert_almost_equal([[self.cam.get_z(1.1234), np.inf], [self.cam.get_z(2.0), self.cam.get_z(4.0)]], actual, 4)
+
+        z = self.cam.get_z(np.array([1.0, 2.0]))
+        self.assertEqual(np.float64, z.dtype)
+        assert_almost_equal([1.0, 2.0], self.cam.get_disparity(z), 6)
+        assert_almost_equal([np.inf], self.cam.get_disparity([0]))
+
     def test_stereo_get_disparity(self):
         z = 23.59613246
         expected = 1.1234
@@ -332,9 +1017,11 @@ class TestDirected(unittest.TestCase):
     def test_deprecation(self):
         pinholeCam = self.cam.get_left_camera()
         with self.assertWarns(DeprecationWarning):
-            self.cam.get_left_camera().fromCameraInfo(self.lmsg)
+            self.assertTrue(PinholeCameraModel().fromCameraInfo(self.lmsg))
+        with self.assertWarns(DeprecationWarning):
+            self.assertFalse(self.cam.get_left_camera().fromCameraInfo(self.lmsg))
         with self.assertWarns(DeprecationWarning):
-            self.cam.fromCameraInfo(self.lmsg, self.rmsg)
+            self.assertFalse(self.cam.fromCameraInfo(self.lmsg, self.rmsg))
         with self.assertWarns(DeprecationWarning):
             assert_almost_equal(pinholeCam.K, pinholeCam._k)
         with self.assertWarns(DeprecationWarning):
@@ -375,14 +1062,36 @@ if __name__ == '__main__':
     suite = unittest.TestSuite()
     suite.addTest(TestDirected('test_stereo'))
     suite.addTest(TestDirected('test_rectify_image'))
+    suite.addTest(TestDirected('test_rectify_image_cache'))
+    suite.addTest(TestDirected('test_shared_map_cache'))
+    suite.addTest(TestDirected('test_map_cache_eviction'))
+    suite.addTest(TestDirected('test_map_cache_directory'))
+    suite.addTest(TestDirected('test_copy'))
+    suite.addTest(TestDirected('test_rectify_image_map_type'))
+    suite.addTest(TestDirected('test_rectify_image_roi'))
+    suite.addTest(TestDirected('test_rectify_image_reduced'))
+    suite.addTest(TestDirected('test_equidistant'))
+    suite.addTest(TestDirected('test_map_types_distortion_models'))
+    suite.addTest(TestDirected('test_from_camera_info_changed'))
     suite.addTest(TestDirected('test_rectify_point'))
+    suite.addTest(TestDirected('test_rectify_points'))
+    suite.addTest(TestDirected('test_unrectify_points'))
+    suite.addTest(TestDirected('test_unrectify_image'))
     suite.addTest(TestDirected('test_project_3d_to_pixel'))
+    suite.addTest(TestDirected('test_project_3d_to_pixels'))
     suite.addTest(TestDirected('test_project_pixel_to_3d_ray'))
+    suite.addTest(TestDirected('test_in_frustum'))
+    suite.addTest(TestDirected('test_project_pixels_to_3d_rays'))
+    suite.addTest(TestDirected('test_ray_grid'))
+    suite.addTest(TestDirected('test_depth_to_points'))
     suite.addTest(TestDirected('test_get_delta_u'))
     suite.addTest(TestDirected('test_get_delta_v'))
     suite.addTest(TestDirected('test_get_delta_x'))
     suite.addTest(TestDirected('test_get_delta_y'))
     suite.addTest(TestDirected('test_full_resolution'))
+    suite.addTest(TestDirected('test_reduced_resolution'))
+    suite.addTest(TestDirected('test_rectified_roi'))
+    suite.addTest(TestDirected('test_to_full_resolution'))
     suite.addTest(TestDirected('test_intrinsic_matrix'))
     suite.addTest(TestDirected('test_distortion_coeffs'))
     suite.addTest(TestDirected('test_rotation_matrix'))
@@ -400,7 +1109,11 @@ if __name__ == '__main__':
     suite.addTest(TestDirected('test_get_tf_frame'))
     suite.addTest(TestDirected('test_stereo_project_3d_to_pixel'))
     suite.addTest(TestDirected('test_stereo_project_pixel_to_3d'))
+    suite.addTest(TestDirected('test_stereo_rectify_pair'))
+    suite.addTest(TestDirected('test_stereo_compute_disparity'))
+    suite.addTest(TestDirected('test_stereo_disparity_to_points'))
     suite.addTest(TestDirected('test_stereo_get_z'))
+    suite.addTest(TestDirected('test_stereo_get_z_array'))
     suite.addTest(TestDirected('test_stereo_get_disparity'))
     suite.addTest(TestDirected('test_deprecation'))
     unittest.TextTestRunner(verbosity=3).run(suite)